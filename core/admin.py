@@ -29,7 +29,8 @@ class SectionAdmin(admin.ModelAdmin):
 
 @admin.register(FormModel)
 class FormModelAdmin(admin.ModelAdmin):
-    list_display = ('serial_number', 'name_ar', 'section', 'category')
+    list_display = ('serial_number', 'name_ar', 'section', 'category', 'page_count')
+    readonly_fields = ('page_count', 'file_sha256')
     list_filter = ('section', 'category')
     search_fields = ('name_ar', 'name_en', 'serial_number')
 
@@ -39,7 +40,7 @@ class UserSectionPermissionAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'message', 'importance', 'created_at')
+    list_display = ('title', 'message', 'importance', 'is_global', 'created_at')
 
 @admin.register(UserNotification)
 class UserNotificationAdmin(admin.ModelAdmin):
@@ -0,0 +1,170 @@
+"""Complaint response-time analytics, aggregated in the database.
+
+Complaints are grouped by recipient type and by the month they were created
+in (local time). For each group the database returns the number of
+complaints, how many were answered, the mean time to response
+(``responded_at - created_at``) and its median / 90th percentile:
+
+- PostgreSQL: ``PERCENTILE_CONT(p) WITHIN GROUP (ORDER BY interval)``, all
+  months in one grouped query;
+- other backends: the percentile is interpolated from the two ordered rows
+  around its position (``OFFSET k LIMIT 2``), one small query per group and
+  percentile. No backend pulls the complaints themselves into Python.
+
+Each month is cached separately under ``complaint-stats:<YYYY-MM>`` for
+``COMPLAINT_STATS_CACHE_TIMEOUT`` seconds; submitting or answering a
+complaint drops the entry of the month it belongs to. The entries live in
+the default cache, which must be shared (Redis / Memcached) when several
+processes serve the API, otherwise other workers keep serving their copy
+until it expires.
+"""
+import math
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Aggregate, Avg, Count, DurationField, ExpressionWrapper, F, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import Complaint
+
+PERCENTILES = (("p50", 0.5), ("p90", 0.9))
+_RESPONDED = Q(responded_at__isnull=False)
+
+
+class PercentileCont(Aggregate):
+    """PostgreSQL ``PERCENTILE_CONT`` (continuous percentile, interpolated)."""
+
+    function = "PERCENTILE_CONT"
+    name = "PercentileCont"
+    template = "%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)"
+
+    def __init__(self, expression, percentile, **extra):
+        if not 0 <= percentile <= 1:
+            raise ValueError("percentile must be between 0 and 1")
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
+def cache_key(month):
+    return f"complaint-stats:{month}"
+
+
+def month_label(value):
+    return timezone.localtime(value).strftime("%Y-%m")
+
+
+def invalidate_complaint_stats(complaint):
+    """Drop the cached month of ``complaint`` once the current transaction commits."""
+    key = cache_key(month_label(complaint.created_at))
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def month_range(first, last):
+    """(year, month) tuples from ``first`` to ``last`` inclusive."""
+    months = []
+    current = first
+    while current <= last:
+        months.append(current)
+        current = _next_month(*current)
+    return months
+
+
+def _month_start(year, month):
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+def _seconds(value):
+    return round(value.total_seconds(), 1) if value is not None else None
+
+
+def _durations(queryset):
+    return queryset.filter(_RESPONDED).annotate(
+        response_time=ExpressionWrapper(F("responded_at") - F("created_at"), output_field=DurationField())
+    )
+
+
+def _offset_percentile(queryset, count, fraction):
+    """Linear-interpolated percentile read from the two rows around its position."""
+    position = fraction * (count - 1)
+    low = math.floor(position)
+    values = list(queryset.order_by("response_time").values_list("response_time", flat=True)[low:low + 2])
+    if len(values) == 1:
+        return values[0]
+    return values[0] + (values[1] - values[0]) * (position - low)
+
+
+def _compute(months):
+    start = _month_start(*months[0])
+    end = _month_start(*_next_month(*months[-1]))
+    base = Complaint.objects.filter(created_at__gte=start, created_at__lt=end)
+
+    aggregates = {
+        "total": Count("id"),
+        "responded": Count("id", filter=_RESPONDED),
+        "avg_response": Avg("response_time", filter=_RESPONDED),
+    }
+    postgres = connection.vendor == "postgresql"
+    if postgres:
+        for name, fraction in PERCENTILES:
+            aggregates[name] = PercentileCont(
+                "response_time", fraction, filter=_RESPONDED, output_field=DurationField()
+            )
+
+    rows = (
+        base.annotate(
+            month=TruncMonth("created_at"),
+            response_time=ExpressionWrapper(F("responded_at") - F("created_at"), output_field=DurationField()),
+        )
+        .values("month", "recipient_type")
+        .annotate(**aggregates)
+        .order_by("month", "recipient_type")
+    )
+
+    stats = {f"{year:04d}-{month:02d}": [] for year, month in months}
+    for row in rows:
+        label = month_label(row["month"])
+        if not postgres and row["responded"]:
+            year, month = map(int, label.split("-"))
+            group = _durations(base.filter(
+                created_at__gte=_month_start(year, month),
+                created_at__lt=_month_start(*_next_month(year, month)),
+                recipient_type=row["recipient_type"],
+            ))
+            for name, fraction in PERCENTILES:
+                row[name] = _offset_percentile(group, row["responded"], fraction)
+        stats[label].append({
+            "month": label,
+            "recipient_type": row["recipient_type"],
+            "total": row["total"],
+            "responded": row["responded"],
+            "response_rate": round(row["responded"] / row["total"], 4) if row["total"] else None,
+            "avg_response_seconds": _seconds(row["avg_response"]),
+            **{f"{name}_response_seconds": _seconds(row.get(name)) for name, _ in PERCENTILES},
+        })
+    return stats
+
+
+def complaint_stats(first, last):
+    """
+    Rows for every month from ``first`` to ``last`` ((year, month) tuples),
+    oldest first, served from the per-month cache where possible.
+    """
+    months = month_range(first, last)
+    labels = [f"{year:04d}-{month:02d}" for year, month in months]
+    cached = cache.get_many([cache_key(label) for label in labels])
+
+    missing = [m for m, label in zip(months, labels) if cache_key(label) not in cached]
+    if missing:
+        # من أول شهر ناقص حتى آخره في استعلام مجمّع واحد
+        computed = _compute(month_range(missing[0], missing[-1]))
+        timeout = getattr(settings, "COMPLAINT_STATS_CACHE_TIMEOUT", 3600)
+        cache.set_many({cache_key(label): computed[label] for label in computed}, timeout)
+        cached.update({cache_key(label): value for label, value in computed.items()})
+
+    return [row for label in labels for row in cached[cache_key(label)]]
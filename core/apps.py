@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        post_migrate.connect(_reinstall_search_index, sender=self)
+
+
+def _reinstall_search_index(using, plan=None, **kwargs):
+    # SQLite يعيد بناء الجداول عند تعديلها فتضيع triggers الخاصة بـ FTS5 (انظر core/search.py)
+    from django.db import connections
+    from .search import install_search_index
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and 'core_complaint' in connection.introspection.table_names():
+        install_search_index(connection)
@@ -0,0 +1,92 @@
+"""In-process pub/sub hub feeding the server-sent events endpoint.
+
+Views publish small JSON events (``{"type": "notification", ...}``) to
+channels; every open ``events/`` connection subscribes to its user channel,
+its role channel (hr / manager) and the broadcast channel. Events carry ids
+only, clients re-fetch what changed.
+
+The hub lives in the process memory: it reaches the connections served by
+the same ASGI worker. Run the event stream on a single ASGI worker (or put
+a shared broker behind ``publish`` later) when several workers serve the
+API.
+"""
+import asyncio
+import threading
+
+from django.db import transaction
+
+BROADCAST = "*"
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def role_channel(role):
+    return f"role:{role}"
+
+
+class Subscription:
+    def __init__(self, loop, channels, queue_size):
+        self.loop = loop
+        self.channels = frozenset(channels)
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # امتلأ الطابور (عميل بطيء): نرسل له resync بدل تراكم الأحداث
+        self.overflowed = False
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventHub:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channels):
+        """Register the calling event loop's connection on ``channels``."""
+        sub = Subscription(asyncio.get_running_loop(), channels, self.queue_size)
+        with self._lock:
+            for channel in sub.channels:
+                self._channels.setdefault(channel, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._channels.get(channel)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._channels[channel]
+
+    def publish(self, channels, event):
+        """Thread-safe: callable from sync views running in worker threads."""
+        with self._lock:
+            targets = set()
+            for channel in channels:
+                targets.update(self._channels.get(channel, ()))
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, event)
+            except RuntimeError:
+                # حلقة الاتصال أُغلقت قبل إلغاء الاشتراك
+                self.unsubscribe(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({sub for subs in self._channels.values() for sub in subs})
+
+
+hub = EventHub()
+
+
+def publish_on_commit(channels, event_type, **data):
+    """Publish once the current transaction commits (right away outside one)."""
+    channels = list(channels)
+    event = {"type": event_type, **data}
+    transaction.on_commit(lambda: hub.publish(channels, event))
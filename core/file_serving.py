@@ -0,0 +1,193 @@
+"""HTTP caching helpers for stored files.
+
+``serve_file`` wraps a ``FieldFile`` in a response that understands
+``If-None-Match`` / ``If-Modified-Since`` (304), single-range ``Range``
+requests (206 / 416) and ``If-Range``, and carries a strong ETag built from
+the stored content hash plus long-lived ``Cache-Control`` headers.
+
+With ``FILE_DELIVERY_BACKEND`` set to ``"x-accel-redirect"`` (nginx) or
+``"x-sendfile"`` (Apache mod_xsendfile, lighttpd) the bytes are not copied
+through Python at all: once the view has done its checks it answers with an
+empty response carrying the redirect header and the front proxy sends the
+file (including Range handling). ``"python"`` (default) streams the file from
+the worker as before.
+"""
+import mimetypes
+import os
+import re
+from datetime import timezone as dt_timezone
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.static import serve
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_CHUNK_SIZE = 64 * 1024
+
+
+def file_last_modified(fieldfile):
+    """Unix timestamp of the stored file, or None when the storage cannot tell."""
+    try:
+        modified = fieldfile.storage.get_modified_time(fieldfile.name)
+    except (NotImplementedError, OSError, ValueError):
+        return None
+    if modified.tzinfo is None:
+        modified = modified.replace(tzinfo=dt_timezone.utc)
+    return int(modified.timestamp())
+
+
+def parse_range(header, size):
+    """
+    يعيد (start, end) شاملة، أو None لتجاهل الرأس (صيغة غير مدعومة أو أكثر من مدى)،
+    أو False إذا كان المدى خارج حجم الملف (416).
+    """
+    match = _RANGE_RE.match((header or "").strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N  → آخر N بايت
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if last and end < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    value = request.META.get("HTTP_IF_RANGE")
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith("W/"):
+        # If-Range يتطلب مقارنة قوية
+        return etag is not None and value == etag
+    since = parse_http_date_safe(value)
+    return since is not None and last_modified is not None and since == last_modified
+
+
+def _offload(content_type, name, path):
+    backend = getattr(settings, "FILE_DELIVERY_BACKEND", "python")
+    if backend == "x-accel-redirect":
+        # name نسبي لـ MEDIA_ROOT الذي يربطه nginx بـ location داخلي (internal + alias)
+        prefix = getattr(settings, "FILE_DELIVERY_ACCEL_PREFIX", "/protected-media/")
+        header, value = "X-Accel-Redirect", prefix.rstrip("/") + "/" + quote(name)
+    elif backend == "x-sendfile":
+        header, value = "X-Sendfile", quote(path)
+    else:
+        return None
+    response = HttpResponse(content_type=content_type)
+    response.headers[header] = value
+    return response
+
+
+def offload_response(fieldfile, content_type, filename=None):
+    """
+    Response that delegates sending ``fieldfile`` to the front proxy, or None
+    when the backend is "python" or the storage has no local file.
+    """
+    try:
+        path = fieldfile.path
+    except NotImplementedError:
+        return None
+    response = _offload(content_type, fieldfile.name, path)
+    if response is not None and filename:
+        response.headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    return response
+
+
+def _range_chunks(fieldfile, start, length):
+    with fieldfile.open("rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _cache_headers(response, etag, last_modified, max_age):
+    if etag:
+        response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified)
+    response.headers["Cache-Control"] = f"public, max-age={max_age}"
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+
+def serve_file(request, fieldfile, content_type, etag=None, max_age=0, filename=None):
+    """
+    Conditional / range-aware response for ``fieldfile``.
+
+    ``etag`` is the raw validator (e.g. a sha256 hex digest); it is sent as a
+    strong ETag. Without it only ``Last-Modified`` is used for revalidation.
+    """
+    etag = quote_etag(etag) if etag else None
+    last_modified = file_last_modified(fieldfile)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return _cache_headers(not_modified, etag, last_modified, max_age)
+
+    offloaded = offload_response(fieldfile, content_type, filename)
+    if offloaded is not None:
+        # الـ Range والإرسال الفعلي يتولاهما الخادم الأمامي
+        return _cache_headers(offloaded, etag, last_modified, max_age)
+
+    size = fieldfile.size
+    byte_range = None
+    if request.method in ("GET", "HEAD") and "HTTP_RANGE" in request.META and \
+            _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META["HTTP_RANGE"], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return _cache_headers(response, etag, last_modified, max_age)
+
+    if byte_range is None:
+        response = FileResponse(fieldfile.open("rb"), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _range_chunks(fieldfile, start, length), status=206, content_type=content_type
+        )
+        response.headers["Content-Length"] = str(length)
+        response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    if filename:
+        response.headers["Content-Disposition"] = f'inline; filename="{filename}"'
+    return _cache_headers(response, etag, last_modified, max_age)
+
+
+def serve_media(request, path, document_root=None):
+    """
+    Drop-in for ``django.views.static.serve`` on MEDIA_URL that offloads to the
+    front proxy when a delivery backend is configured.
+    """
+    document_root = document_root or settings.MEDIA_ROOT
+    if getattr(settings, "FILE_DELIVERY_BACKEND", "python") not in ("x-accel-redirect", "x-sendfile"):
+        return serve(request, path, document_root=document_root)
+    try:
+        full_path = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404("Invalid path")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+    name = os.path.relpath(full_path, document_root).replace(os.sep, "/")
+    content_type = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+    return _offload(content_type, name, full_path)
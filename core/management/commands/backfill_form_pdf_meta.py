@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from core.models import FormModel
+
+
+class Command(BaseCommand):
+    help = "Compute PDF structure metadata (page count, sizes, xref offsets, hash) for existing forms."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Recompute metadata even for forms that already have it.",
+        )
+
+    def handle(self, *args, **options):
+        force = options["force"]
+        self.stdout.write("📁 Scanning forms...")
+
+        updated = 0
+        skipped = 0
+        failed = 0
+
+        for form in FormModel.objects.exclude(file="").order_by("id").iterator():
+            if not force and form.has_fresh_pdf_meta():
+                skipped += 1
+                continue
+            try:
+                refreshed = form.refresh_pdf_meta()
+            except Exception as exc:
+                refreshed, error = False, exc
+            else:
+                error = "file could not be opened"
+            if not refreshed:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f"⚠️ Form {form.id} ({form.file.name}): {error}"))
+                continue
+            updated += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✔️ Done. Updated: {updated}, already up to date: {skipped}, failed: {failed}."
+        ))
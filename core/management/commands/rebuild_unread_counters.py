@@ -0,0 +1,43 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import UnreadCounter
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored unread counters (notifications and complaints) from the source tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all-users",
+            action="store_true",
+            help="Create counters for every user, not only for users that already have one.",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("🔢 Rebuilding unread counters...")
+
+        with transaction.atomic():
+            global_values = {**UnreadCounter.compute_global(), "computed_at": timezone.now()}
+            UnreadCounter.objects.update_or_create(role=UnreadCounter.GLOBAL, defaults=global_values)
+            for role in ("hr", "manager"):
+                UnreadCounter.objects.update_or_create(
+                    role=role, defaults={**UnreadCounter.compute_role(role), "computed_at": timezone.now()}
+                )
+        total = global_values["notifications"]
+
+        users = get_user_model().objects.order_by("id")
+        if not options["all_users"]:
+            users = users.filter(unread_counter__isnull=False)
+
+        rebuilt = 0
+        for user in users.iterator():
+            with transaction.atomic():
+                UnreadCounter.objects.update_or_create(
+                    user=user, defaults={**UnreadCounter.compute_user(user, total), "computed_at": timezone.now()}
+                )
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"✔️ Done. Global and role counters rebuilt, users: {rebuilt}."))
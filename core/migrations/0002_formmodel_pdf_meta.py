@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formmodel',
+            name='file_sha256',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='formmodel',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='formmodel',
+            name='pdf_meta',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_formmodel_pdf_meta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='is_global',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.CreateModel(
+            name='NotificationReadWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('global_read_until', models.DateTimeField(blank=True, null=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='notification_watermark', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
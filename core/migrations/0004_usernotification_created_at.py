@@ -0,0 +1,38 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:16
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_notification_created_at(apps, schema_editor):
+    UserNotification = apps.get_model('core', 'UserNotification')
+    Notification = apps.get_model('core', 'Notification')
+    UserNotification.objects.update(
+        created_at=models.Subquery(
+            Notification.objects.filter(pk=models.OuterRef('notification_id')).values('created_at')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_notification_is_global'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usernotification',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.RunPython(copy_notification_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['is_global', '-created_at', '-id'], name='notif_global_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(fields=['user', '-created_at', '-notification'], name='usernotif_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_usernotification_created_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(blank=True, max_length=10, null=True, unique=True)),
+                ('notifications', models.IntegerField(default=0)),
+                ('complaints', models.IntegerField(default=0)),
+                ('global_seen', models.IntegerField(default=0)),
+                ('user', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='unread_counter', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_unreadcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationreadwatermark',
+            name='global_hidden_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usernotification',
+            name='is_hidden',
+            field=models.BooleanField(default=False),
+        ),
+    ]
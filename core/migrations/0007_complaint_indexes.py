@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_notification_hidden'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['recipient_type', '-created_at'], name='complaint_recip_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['sender', '-created_at'], name='complaint_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('is_seen_by_recipient', False)), fields=['recipient_type'], name='complaint_unseen_recip_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(condition=models.Q(('is_responded', True), ('is_seen_by_employee', False)), fields=['sender'], name='complaint_unseen_reply_idx'),
+        ),
+    ]
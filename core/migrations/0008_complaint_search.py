@@ -0,0 +1,44 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:24
+
+from django.db import migrations, models
+
+from core.search import complaint_search_text, drop_search_index, install_search_index
+
+
+def fill_search_text(apps, schema_editor):
+    Complaint = apps.get_model('core', 'Complaint')
+    batch = []
+    for complaint in Complaint.objects.only('id', 'title', 'message', 'response').iterator(chunk_size=1000):
+        complaint.search_text = complaint_search_text(complaint)
+        batch.append(complaint)
+        if len(batch) >= 1000:
+            Complaint.objects.bulk_update(batch, ['search_text'])
+            batch = []
+    if batch:
+        Complaint.objects.bulk_update(batch, ['search_text'])
+
+
+def create_index(apps, schema_editor):
+    install_search_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_complaint_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='complaint',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        # GIN على PostgreSQL، FTS5 على SQLite؛ بقية القواعد تبحث بـ icontains
+        migrations.RunPython(create_index, drop_index),
+    ]
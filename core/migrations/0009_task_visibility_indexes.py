@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_complaint_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['creator_role', '-created_at'], name='task_role_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', '-created_at'], name='task_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrecipient',
+            index=models.Index(fields=['user', 'task'], name='taskrecip_user_task_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrecipient',
+            index=models.Index(fields=['is_hr_team', 'task'], name='taskrecip_hrteam_task_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_task_visibility_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='taskcomment',
+            index=models.Index(fields=['task', 'id'], name='taskcomment_task_id_idx'),
+        ),
+    ]
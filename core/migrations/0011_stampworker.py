@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_taskcomment_thread_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StampWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hostname', models.CharField(max_length=255)),
+                ('pid', models.PositiveIntegerField()),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 15:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_stampworker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='unreadcounter',
+            name='computed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
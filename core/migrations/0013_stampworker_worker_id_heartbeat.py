@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-18 16:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def number_existing_workers(apps, schema_editor):
+    # أحدث 1000 صف فقط يمكن أن تكون لعمليات حية بأرقام (id mod 1000) غير متكررة
+    StampWorker = apps.get_model('core', 'StampWorker')
+    keep = list(StampWorker.objects.order_by('-id').values_list('id', flat=True)[:1000])
+    StampWorker.objects.exclude(id__in=keep).delete()
+    for worker in StampWorker.objects.all():
+        worker.worker_id = worker.id % 1000
+        worker.save(update_fields=['worker_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_unreadcounter_computed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stampworker',
+            name='heartbeat_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='stampworker',
+            name='worker_id',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.RunPython(number_existing_workers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stampworker',
+            name='worker_id',
+            field=models.PositiveSmallIntegerField(unique=True),
+        ),
+    ]
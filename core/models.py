@@ -1,4 +1,11 @@
-from django.db import models
+import hashlib
+import os
+import socket
+from datetime import timedelta
+from itertools import islice
+
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
@@ -34,9 +41,106 @@ class FormModel(models.Model):
     description = models.TextField(blank=True)
     file = models.FileField(upload_to='forms/') 
 
+    # بيانات بنية الـ PDF تُحسب مرة واحدة عند الحفظ (انظر refresh_pdf_meta)
+    page_count = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    file_sha256 = models.CharField(max_length=64, blank=True, default='', editable=False)
+    pdf_meta = models.JSONField(null=True, blank=True, editable=False)
+
     def __str__(self):
         return f"{self.name_ar} ({self.serial_number})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.file and not self.has_fresh_pdf_meta():
+            self.refresh_pdf_meta()
+
+    def has_fresh_pdf_meta(self, check_size=False):
+        meta = self.pdf_meta or {}
+        if not self.file or meta.get('name') != self.file.name:
+            return False
+        try:
+            return not check_size or meta.get('size') == self.file.size
+        except OSError:
+            return False
+
+    def refresh_pdf_meta(self):
+        """
+        يقرأ الملف مرة واحدة: hash + عدد الصفحات + المقاسات + مواقع xref والكائنات
+        (نفس ما يحتاجه محرك الختم incremental) ويخزنها دون استدعاء save() من جديد.
+        إن تعذّر فتح الملف (مفقود من التخزين) تبقى البيانات القديمة ويرجع False؛
+        backfill_form_pdf_meta يعيد المحاولة لاحقًا.
+        """
+        from .stamping import describe_pdf
+
+        digest = hashlib.sha256()
+        try:
+            with self.file.open('rb') as f:
+                for chunk in f.chunks():
+                    digest.update(chunk)
+                try:
+                    meta = describe_pdf(f)
+                except Exception:
+                    meta = {'size': self.file.size, 'incremental': False, 'page_count': None, 'pages': []}
+        except OSError:
+            return False
+        meta['name'] = self.file.name
+        meta['sha256'] = digest.hexdigest()
+
+        self.pdf_meta = meta
+        self.page_count = meta.get('page_count')
+        self.file_sha256 = meta['sha256']
+        type(self).objects.filter(pk=self.pk).update(
+            pdf_meta=self.pdf_meta, page_count=self.page_count, file_sha256=self.file_sha256
+        )
+        return True
+
+class StampWorker(models.Model):
+    """
+    صف لكل عملية تختم النماذج دون STAMP_WORKER_ID صريح؛ worker_id (0-999، فريد) هو رقم العامل
+    داخل الرقم التسلسلي (انظر core/serials.py).
+    العملية تجدد heartbeat_at أثناء عملها (beat)، والصف الذي لم يُجدَّد خلال STAMP_WORKER_TTL
+    يُحذف عند الحجز التالي فيعود رقمه متاحًا؛ الحجز يأخذ أصغر رقم غير مستخدم.
+    """
+    worker_id = models.PositiveSmallIntegerField(unique=True)
+    hostname = models.CharField(max_length=255)
+    pid = models.PositiveIntegerField()
+    started_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    @staticmethod
+    def ttl():
+        return timedelta(seconds=getattr(settings, 'STAMP_WORKER_TTL', 3600))
+
+    @classmethod
+    def claim(cls):
+        """Register the calling process under the lowest free serial worker id (0-999)."""
+        from .serials import WORKER_ID_LIMIT
+
+        while True:
+            now = timezone.now()
+            cls.objects.filter(heartbeat_at__lt=now - cls.ttl()).delete()
+            used = set(cls.objects.values_list('worker_id', flat=True))
+            free = next((i for i in range(WORKER_ID_LIMIT) if i not in used), None)
+            if free is None:
+                raise RuntimeError("All stamp worker ids are in use")
+            try:
+                with transaction.atomic():
+                    return cls.objects.create(
+                        worker_id=free, hostname=socket.gethostname()[:255], pid=os.getpid(), heartbeat_at=now
+                    )
+            except IntegrityError:
+                # عملية أخرى حجزت نفس الرقم للتو
+                continue
+
+    def beat(self):
+        """Renew the claim; False when it already expired (the id may belong to another process now)."""
+        now = timezone.now()
+        if not type(self).objects.filter(pk=self.pk).update(heartbeat_at=now):
+            return False
+        self.heartbeat_at = now
+        return True
+
+
 class UserSectionPermission(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     section = models.ForeignKey(Section, on_delete=models.CASCADE)
@@ -54,17 +158,110 @@ class Notification(models.Model):
     message = models.TextField()
     importance = models.CharField(max_length=10, choices=IMPORTANCE_CHOICES, default='normal')
     created_at = models.DateTimeField(auto_now_add=True)
+    # إشعار عام لكل الموظفين: يُخزن مرة واحدة بدون UserNotification لكل مستخدم،
+    # وحالة القراءة استثناءات (UserNotification مقروء) أو NotificationReadWatermark
+    is_global = models.BooleanField(default=False, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_global', '-created_at', '-id'], name='notif_global_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def inbox_for(cls, user):
+        """
+        إشعارات المستخدم (الموجّهة له + العامة منذ انضمامه) في استعلام واحد، مع:
+          user_row_id: معرف UserNotification إن وُجد (None لإشعار عام لم يُقرأ)
+          read_state:  حالة القراءة بعد تطبيق الاستثناءات و watermark
+        """
+        rows = UserNotification.objects.filter(user=user, notification=models.OuterRef('pk'))
+        watermark = NotificationReadWatermark.objects.filter(user=user)
+        return cls.objects.annotate(
+            hidden_until=models.Subquery(watermark.values('global_hidden_until')[:1]),
+        ).filter(
+            models.Q(models.Exists(rows.filter(is_hidden=False))) |
+            models.Q(
+                models.Q(hidden_until__isnull=True) | models.Q(created_at__gt=models.F('hidden_until')),
+                is_global=True, created_at__gte=user.date_joined,
+            ),
+            ~models.Exists(rows.filter(is_hidden=True)),
+        ).annotate(
+            user_row_id=models.Subquery(rows.values('id')[:1]),
+            row_is_read=models.Subquery(rows.values('is_read')[:1]),
+            read_until=models.Subquery(watermark.values('global_read_until')[:1]),
+        ).annotate(
+            read_state=models.Case(
+                models.When(row_is_read__isnull=False, then=models.F('row_is_read')),
+                models.When(read_until__gte=models.F('created_at'), then=models.Value(True)),
+                default=models.Value(False),
+                output_field=models.BooleanField(),
+            )
+        )
+
+    def deliver_to(self, users, batch_size=1000):
+        """
+        ينشئ UserNotification لكل مستخدم في users (QuerySet) على دفعات من المعرفات فقط
+        بدل تحميل كائنات المستخدمين، داخل transaction واحدة مع تجاهل المكرر.
+        يرجع عدد المستلمين.
+        """
+        user_ids = users.order_by().values_list('id', flat=True).iterator(chunk_size=batch_size)
+        count = 0
+        with transaction.atomic():
+            while True:
+                batch = list(islice(user_ids, batch_size))
+                if not batch:
+                    break
+                UserNotification.objects.bulk_create(
+                    [UserNotification(user_id=user_id, notification=self, created_at=self.created_at)
+                     for user_id in batch],
+                    batch_size=batch_size,
+                    ignore_conflicts=True,
+                )
+                UnreadCounter.add(users=batch, notifications=1)
+                count += len(batch)
+        return count
+
 class UserNotification(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     notification = models.ForeignKey(Notification, on_delete=models.CASCADE)
     is_read = models.BooleanField(default=False)
+    # حذف المستخدم لإشعار عام: يبقى الصف كاستثناء مخفي (الإشعار نفسه مشترك)
+    is_hidden = models.BooleanField(default=False)
+    # نسخة من notification.created_at لترتيب صندوق المستخدم وتقسيمه بالمؤشر عبر فهرس (user, created_at)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         unique_together = ('user', 'notification')
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-notification'], name='usernotif_user_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.notification_id:
+            self.created_at = self.notification.created_at
+        super().save(*args, **kwargs)
+
+
+class NotificationReadWatermark(models.Model):
+    """
+    كل إشعار عام أُنشئ قبل global_read_until (أو عنده) يُعتبر مقروءًا لهذا المستخدم،
+    وكل ما أُنشئ قبل global_hidden_until (أو عنده) محذوف من صندوقه.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notification_watermark')
+    global_read_until = models.DateTimeField(null=True, blank=True)
+    global_hidden_until = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def advance(cls, user, field, until):
+        """يرفع global_read_until / global_hidden_until إلى until (لا يرجع للخلف). يرجع القيمة السابقة."""
+        watermark, _ = cls.objects.select_for_update().get_or_create(user=user)
+        previous = getattr(watermark, field)
+        if previous is None or until > previous:
+            cls.objects.filter(pk=watermark.pk).update(**{field: until})
+        return previous
 
 
 from django.contrib.auth import get_user_model
@@ -90,9 +287,172 @@ class Complaint(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # العنوان + النص + الرد بعد توحيد الحروف العربية؛ مفهرس للبحث النصي (انظر core/search.py)
+    search_text = models.TextField(blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            # hr_complaints / manager_complaints و my_complaints (ترتيب -created_at)
+            models.Index(fields=['recipient_type', '-created_at'], name='complaint_recip_created_idx'),
+            models.Index(fields=['sender', '-created_at'], name='complaint_sender_created_idx'),
+            # has_unread_complaints: غير المقروء فقط (فهارس جزئية صغيرة)
+            models.Index(
+                fields=['recipient_type'], condition=models.Q(is_seen_by_recipient=False),
+                name='complaint_unseen_recip_idx',
+            ),
+            models.Index(
+                fields=['sender'], condition=models.Q(is_responded=True, is_seen_by_employee=False),
+                name='complaint_unseen_reply_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"Complaint by {self.sender.username} to {self.recipient_type}"
 
+    def save(self, *args, **kwargs):
+        from .search import complaint_search_text
+
+        self.search_text = complaint_search_text(self)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'title', 'message', 'response'} & set(update_fields):
+            kwargs['update_fields'] = list(update_fields) + ['search_text']
+        super().save(*args, **kwargs)
+
+
+class UnreadCounter(models.Model):
+    """
+    عدادات غير المقروء المخزنة بدل COUNT/EXISTS عند كل استطلاع:
+      صف لكل مستخدم (user): notifications = الإشعارات الموجّهة غير المقروءة،
+          complaints = ردود على شكاواه لم يقرأها، global_seen = ما احتُسب له من الإشعارات العامة
+      صف لكل دور (role='hr' / 'manager'): complaints = الشكاوى الموجّهة له ولم تُقرأ
+      صف role='global': notifications = عدد كل الإشعارات العامة
+    غير المقروء من العامة للمستخدم = global.notifications - user.global_seen.
+    الصف يُنشأ فارغًا عند أول قراءة ثم يُحسب بدقة (compute_*) وهو مقفول بـ select_for_update:
+    أي add() متزامن إما انتهى قبل القفل (ومحسوب في compute) أو ينتظر القفل ويُطبق فوق الحساب.
+    التغييرات تُطبق بـ F() على الصفوف الموجودة فقط.
+    الحذف عبر API يمر بـ discount()؛ rebuild_unread_counters يعيد حسابها كلها (مثلًا بعد الحذف من لوحة الإدارة).
+    """
+    GLOBAL = 'global'
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='unread_counter'
+    )
+    role = models.CharField(max_length=10, null=True, blank=True, unique=True)
+    notifications = models.IntegerField(default=0)
+    complaints = models.IntegerField(default=0)
+    global_seen = models.IntegerField(default=0)
+    # فارغ = الصف أُنشئ ولم يُحسب بعد (أو أُنشئ قبل هذا الحقل)، فيُحسب عند القراءة التالية
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Unread counter ({self.user_id or self.role})"
+
+    @classmethod
+    def add(cls, users=None, role=None, **deltas):
+        """يزيد/ينقص الحقول (notifications=1, complaints=-2, ...) على صفوف users (معرفات) أو role."""
+        changes = {field: models.F(field) + delta for field, delta in deltas.items() if delta}
+        if not changes:
+            return
+        qs = cls.objects.filter(user_id__in=users) if users is not None else cls.objects.filter(role=role)
+        qs.update(**changes)
+
+    @classmethod
+    def discount(cls, notification):
+        """
+        يطرح أثر notification من العدادات قبل حذفه (الحذف يتم بعدها في نفس المعاملة):
+          موجّه: notifications - 1 لكل من لم يقرأه
+          عام:   الإجمالي العام - 1، و global_seen - 1 لكل من كان محتسبًا له (قرأه أو قبل انضمامه)
+        """
+        if not notification.is_global:
+            unread = UserNotification.objects.filter(notification=notification, is_read=False)
+            cls.add(users=list(unread.values_list('user_id', flat=True)), notifications=-1)
+            return
+        cls.add(role=cls.GLOBAL, notifications=-1)
+        seen = (
+            models.Q(user__date_joined__gt=notification.created_at) |
+            models.Q(user__notification_watermark__global_read_until__gte=notification.created_at) |
+            models.Q(models.Exists(UserNotification.objects.filter(
+                user=models.OuterRef('user'), notification=notification, is_read=True
+            )))
+        )
+        cls.objects.filter(seen, user__isnull=False).update(global_seen=models.F('global_seen') - 1)
+
+    @classmethod
+    def compute_global(cls):
+        return {'notifications': Notification.objects.filter(is_global=True).count()}
+
+    @classmethod
+    def compute_role(cls, role):
+        return {'complaints': Complaint.objects.filter(recipient_type=role, is_seen_by_recipient=False).count()}
+
+    @classmethod
+    def compute_user(cls, user, global_total):
+        read_until = NotificationReadWatermark.objects.filter(user=user).values_list(
+            'global_read_until', flat=True
+        ).first()
+        unread_global = Notification.objects.filter(is_global=True, created_at__gte=user.date_joined).exclude(
+            models.Exists(UserNotification.objects.filter(user=user, notification=models.OuterRef('pk'), is_read=True))
+        )
+        if read_until is not None:
+            unread_global = unread_global.filter(created_at__gt=read_until)
+        return {
+            'notifications': UserNotification.objects.filter(
+                user=user, is_read=False, notification__is_global=False
+            ).count(),
+            'complaints': Complaint.objects.filter(
+                sender=user, is_responded=True, is_seen_by_employee=False
+            ).count(),
+            'global_seen': global_total - unread_global.count(),
+        }
+
+    @classmethod
+    def _get_or_compute(cls, lookup, compute):
+        row = cls.objects.filter(**lookup).first()
+        if row is not None and row.computed_at is not None:
+            return row
+        # الصف موجود أولًا حتى لا تضيع أي زيادة بين الحساب والإدراج
+        cls.objects.get_or_create(**lookup)
+        with transaction.atomic():
+            row = cls.objects.select_for_update().get(**lookup)
+            if row.computed_at is None:
+                for field, value in compute().items():
+                    setattr(row, field, value)
+                row.computed_at = timezone.now()
+                row.save()
+        return row
+
+    @classmethod
+    def _locked_global_total(cls):
+        # يُقرأ داخل معاملة حساب صف المستخدم: إرسال عام متزامن ينتهي قبله أو ينتظره
+        return cls.objects.select_for_update().get(role=cls.GLOBAL).notifications
+
+    @classmethod
+    def unread_for(cls, user):
+        """{'notifications': n, 'complaints': n} للمستخدم (الشكاوى حسب الدور كما في has_unread_complaints)."""
+        role = getattr(user, 'role', None)
+        role = role if role in ('hr', 'manager') else None
+        rows = {
+            (row.user_id and 'user') or row.role: row
+            for row in cls.objects.filter(models.Q(user=user) | models.Q(role__in=[cls.GLOBAL, role]))
+        }
+        if cls.GLOBAL not in rows or rows[cls.GLOBAL].computed_at is None:
+            rows[cls.GLOBAL] = cls._get_or_compute({'role': cls.GLOBAL}, cls.compute_global)
+        if 'user' not in rows or rows['user'].computed_at is None:
+            rows['user'] = cls._get_or_compute(
+                {'user': user}, lambda: cls.compute_user(user, cls._locked_global_total())
+            )
+            # قد يكون الإجمالي العام تغيّر أثناء الحساب
+            rows[cls.GLOBAL] = cls.objects.get(role=cls.GLOBAL)
+        if role and (role not in rows or rows[role].computed_at is None):
+            rows[role] = cls._get_or_compute({'role': role}, lambda: cls.compute_role(role))
+
+        mine = rows['user']
+        unread_global = max(rows[cls.GLOBAL].notifications - mine.global_seen, 0)
+        return {
+            'notifications': max(mine.notifications, 0) + unread_global,
+            'complaints': max((rows[role] if role else mine).complaints, 0),
+        }
+
 # =================== [Tasks Feature] Models ===================
 from django.conf import settings as _settings
 from django.utils import timezone as _timezone
@@ -125,15 +485,36 @@ class Task(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # قائمة المدير/HR حسب creator_role، وفلترة الحالة، كلاهما بترتيب الأحدث
+            models.Index(fields=["creator_role", "-created_at"], name="task_role_created_idx"),
+            models.Index(fields=["status", "-created_at"], name="task_status_created_idx"),
+        ]
 
+    # phase_total / phase_success_total: يضيفهما TaskViewSet.get_queryset بـ annotate،
+    # وإن غابا نستعمل phases المحمّلة مسبقًا (prefetch) قبل اللجوء إلى COUNT
     @property
     def total_phases(self) -> int:
+        if hasattr(self, "phase_total"):
+            return self.phase_total
+        if "phases" in getattr(self, "_prefetched_objects_cache", {}):
+            return len(self.phases.all())
         return self.phases.count()
 
     @property
     def success_phases(self) -> int:
+        if hasattr(self, "phase_success_total"):
+            return self.phase_success_total
+        if "phases" in getattr(self, "_prefetched_objects_cache", {}):
+            return sum(1 for phase in self.phases.all() if phase.status == TaskPhaseStatus.SUCCESS)
         return self.phases.filter(status=TaskPhaseStatus.SUCCESS).count()
 
+    def reset_progress(self):
+        """Forget annotated / prefetched phase counts after the phases changed."""
+        self.__dict__.pop("phase_total", None)
+        self.__dict__.pop("phase_success_total", None)
+        getattr(self, "_prefetched_objects_cache", {}).pop("phases", None)
+
     @property
     def progress_percent(self) -> float:
         total = self.total_phases
@@ -187,6 +568,11 @@ class TaskRecipient(models.Model):
                 name="recipient_is_user_xor_hrteam"
             )
         ]
+        indexes = [
+            # فحوص Exists في TaskViewSet: "هل المستخدم/فريق HR مستلم لهذه المهمة؟"
+            models.Index(fields=["user", "task"], name="taskrecip_user_task_idx"),
+            models.Index(fields=["is_hr_team", "task"], name="taskrecip_hrteam_task_idx"),
+        ]
 
 class TaskComment(models.Model):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="comments")
@@ -194,6 +580,12 @@ class TaskComment(models.Model):
     text = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # خيط التعليقات بالمؤشر (id > since) وآخر تعليق للـ ETag
+            models.Index(fields=["task", "id"], name="taskcomment_task_id_idx"),
+        ]
+
 
 # ====================================
 # =========================
@@ -1,4 +1,10 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class StandardResultsSetPagination(PageNumberPagination):
     """Page-number pagination with safe defaults.
@@ -8,3 +14,58 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size = 10
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+class KeysetPagination:
+    """Cursor (keyset) pagination helpers: no OFFSET and no COUNT(*) unless asked.
+
+    The view orders its rows by a unique key (e.g. ``(-created_at, -id)``),
+    fetches ``page_size + 1`` rows after the cursor and passes the key of the
+    last returned row to ``get_paginated_response``.
+    - ?cursor=...      opaque position returned in ``next``
+    - ?page_size=...   same limits as StandardResultsSetPagination
+    - ?include_count=false  skip the total count
+    """
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def include_count(self, request):
+        return request.query_params.get("include_count", "true").lower() not in ("false", "0", "no")
+
+    def decode_cursor(self, request):
+        """Key tuple from ?cursor= or None for the first page."""
+        return self.decode(request.query_params.get(self.cursor_query_param))
+
+    def decode(self, encoded):
+        if not encoded:
+            return None
+        try:
+            return tuple(json.loads(urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8")))
+        except (AttributeError, TypeError, ValueError, UnicodeError):
+            raise NotFound("Invalid cursor")
+
+    def encode_cursor(self, key):
+        return urlsafe_b64encode(json.dumps(list(key), default=str).encode("utf-8")).decode("ascii")
+
+    def get_next_link(self, request, key):
+        if key is None:
+            return None
+        return replace_query_param(request.build_absolute_uri(), self.cursor_query_param, self.encode_cursor(key))
+
+    def get_paginated_response(self, request, data, next_key, count=None):
+        body = {}
+        if count is not None:
+            body["count"] = count
+        body["next"] = self.get_next_link(request, next_key)
+        body["previous"] = None
+        body["results"] = data
+        return Response(body)
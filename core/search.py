@@ -0,0 +1,138 @@
+"""Complaint full-text search.
+
+Complaint.search_text holds the Arabic-normalised title, message and
+response, with the definite article stripped so "الراتب" and "راتب" match.
+It is indexed per backend:
+
+- PostgreSQL: GIN index on ``to_tsvector('simple', search_text)``;
+- SQLite: external-content FTS5 table ``core_complaint_fts`` kept in sync
+  by triggers (local runs and tests);
+- anything else: plain ``icontains`` on search_text (no index).
+
+``search_complaints`` returns the queryset annotated with ``rank``
+(higher is better) so the caller can order by ``(-rank, -id)`` and
+paginate by keyset. The index is created by migration 0008; on SQLite
+``install_search_index`` also runs after every migrate, because Django
+rebuilds SQLite tables on schema changes and the triggers go with them.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+# التشكيل + علامات القرآن + ألف خنجرية + التطويل
+_DIACRITICS_RE = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+# أشكال الألف → ا، ى → ي، ة → ه، ؤ → و، ئ → ي
+_FOLD = str.maketrans("أإآٱىةؤئ", "اااايهوي")
+_TOKEN_RE = re.compile(r"\w+")
+# أداة التعريف وما يسبقها من حروف العطف والجر: "والراتب" / "بالراتب" / "الراتب" → "راتب"
+_ARTICLE_RE = re.compile(r"^(?:[وفبك]?ال|لل)(?=\w\w)")
+
+FTS_TABLE = "core_complaint_fts"
+_COMPLAINT_TABLE = "core_complaint"
+
+_POSTGRES_INDEX_SQL = (
+    f"CREATE INDEX IF NOT EXISTS complaint_search_gin ON {_COMPLAINT_TABLE} "
+    "USING GIN (to_tsvector('simple'::regconfig, COALESCE(search_text, '')))"
+)
+_SQLITE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    f"USING fts5(search_text, content='{_COMPLAINT_TABLE}', content_rowid='id')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {_COMPLAINT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {_COMPLAINT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON {_COMPLAINT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text); "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text); END",
+]
+
+
+def install_search_index(conn=None):
+    """Create the backend's text index if missing (idempotent)."""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "postgresql":
+            cursor.execute(_POSTGRES_INDEX_SQL)
+        elif conn.vendor == "sqlite":
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f"{FTS_TABLE}_%"]
+            )
+            intact = cursor.fetchone()[0] == 3
+            for sql in _SQLITE_FTS_SQL:
+                cursor.execute(sql)
+            if not intact:
+                # الجدول أُعيد بناؤه أو أُنشئ للتو: نعيد ملء الفهرس من search_text
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_index(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "postgresql":
+            cursor.execute("DROP INDEX IF EXISTS complaint_search_gin")
+        elif conn.vendor == "sqlite":
+            for suffix in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def normalize_arabic(text):
+    """Fold alef / ya / ta-marbuta variants, strip diacritics and tatweel, lowercase."""
+    if not text:
+        return ""
+    text = _DIACRITICS_RE.sub("", text).translate(_FOLD).lower()
+    return " ".join(text.split())
+
+
+def _strip_articles(text):
+    return [_ARTICLE_RE.sub("", token) for token in _TOKEN_RE.findall(normalize_arabic(text))]
+
+
+def complaint_search_text(complaint):
+    """Indexed form of a complaint: normalised words without the definite article."""
+    return " ".join(_strip_articles(" ".join(filter(None, [complaint.title, complaint.message, complaint.response]))))
+
+
+def search_tokens(query):
+    return _strip_articles(query)
+
+
+def search_complaints(queryset, query):
+    """
+    Filter ``queryset`` (Complaint) to matches of ``query`` and annotate
+    ``rank``. Every token must match, as a prefix (search-as-you-type).
+    """
+    tokens = search_tokens(query)
+    if not tokens:
+        # علامات ترقيم فقط مثلًا: لا نتائج، مع rank حتى يبقى order_by("-rank") صالحًا
+        return queryset.none().annotate(rank=Value(0.0, output_field=FloatField()))
+
+    vendor = connection.vendor
+    if vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        # نفس التعبير الموجود في فهرس GIN حتى يستخدمه المخطط
+        vector = SearchVector("search_text", config="simple")
+        tsquery = SearchQuery(" & ".join(f"{token}:*" for token in tokens), config="simple", search_type="raw")
+        return queryset.annotate(search=vector).filter(search=tsquery).annotate(
+            rank=SearchRank(vector, tsquery)
+        )
+
+    if vendor == "sqlite":
+        match = " ".join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+        table = queryset.model._meta.db_table
+        # bm25 أصغر = أفضل، نعكسه ليكون rank أكبر = أفضل كما في PostgreSQL
+        rank = RawSQL(
+            f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id",
+            [match],
+            output_field=FloatField(),
+        )
+        ids = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        return queryset.filter(id__in=ids).annotate(rank=rank)
+
+    for token in tokens:
+        queryset = queryset.filter(search_text__icontains=token)
+    return queryset.annotate(rank=Value(1.0, output_field=FloatField()))
@@ -33,8 +33,9 @@ class FormModelSerializer(serializers.ModelSerializer):
         model = FormModel
         fields = [
             'id', 'serial_number', 'name_ar', 'name_en',
-            'category', 'description', 'file', 'section'
+            'category', 'description', 'file', 'section', 'page_count'
         ]
+        read_only_fields = ['page_count']
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -42,7 +43,9 @@ class NotificationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Notification
-        fields = ['id', 'title', 'message', 'importance', 'importance_display', 'created_at']
+        fields = ['id', 'title', 'message', 'importance', 'importance_display', 'created_at', 'is_global']
+        # الإشعار العام يُنشأ فقط عبر send_notification (عدادات + بث)، لا عبر POST notifications/
+        read_only_fields = ['is_global']
 
 class UserNotificationSerializer(serializers.ModelSerializer):
     notification = NotificationSerializer()
@@ -51,6 +54,16 @@ class UserNotificationSerializer(serializers.ModelSerializer):
         model = UserNotification
         fields = ['id', 'notification', 'is_read']
 
+class InboxNotificationSerializer(serializers.Serializer):
+    """
+    عنصر صندوق الإشعارات من Notification.inbox_for بنفس شكل UserNotificationSerializer.
+    id معرف UserNotification، ويكون null لإشعار عام لم يُقرأ ولم يُحذف بعد: يُعالَج برقم
+    notification.id عبر user-notifications/global/<id>/mark_as_read و global/<id>/delete.
+    """
+    id = serializers.IntegerField(source='user_row_id', allow_null=True, read_only=True)
+    notification = NotificationSerializer(source='*', read_only=True)
+    is_read = serializers.BooleanField(source='read_state', read_only=True)
+
 class ComplaintSerializer(serializers.ModelSerializer):
     sender_username = serializers.CharField(source='sender.username', read_only=True)
     recipient_display = serializers.SerializerMethodField()
@@ -59,7 +72,7 @@ class ComplaintSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Complaint
-        fields = '__all__'
+        exclude = ['search_text']
         read_only_fields = [
             'sender',
             'sender_username',
@@ -75,6 +88,9 @@ class ComplaintSerializer(serializers.ModelSerializer):
 
 # === [Tasks Feature] Serializers ===
 from django.contrib.auth import get_user_model as _get_user_model
+from collections import defaultdict as _defaultdict, deque as _deque
+from django.db import transaction as _transaction
+from django.db.models import F as _F, prefetch_related_objects as _prefetch_related_objects
 from rest_framework import serializers as _s
 from .models import Task, TaskPhase, TaskRecipient, TaskComment, TaskStatus, TaskPhaseStatus
 
@@ -92,6 +108,75 @@ def _infer_role(user):
         return "hr"
     return "employee"
 
+def _recipient_rows(task, user_ids, to_hr_team):
+    rows = [TaskRecipient(task=task, user_id=uid) for uid in dict.fromkeys(user_ids or [])]
+    if to_hr_team:
+        rows.append(TaskRecipient(task=task, is_hr_team=True))
+    return rows
+
+
+def _sync_phases(task, texts):
+    """
+    يطابق مراحل المهمة مع texts (بالترتيب) بعدد ثابت من الاستعلامات مع الحفاظ على حالة المراحل:
+    - المرحلة بنفس النص تبقى (مع status و completed_at) ويتغير ترتيبها فقط عند الحاجة
+    - نص جديد في موضع مرحلة غير مطابقة يُعتبر تعديلًا لنصها
+    - ما بقي بلا مطابقة يُحذف، والنصوص الباقية تُنشأ
+    """
+    existing = list(task.phases.all())
+    by_text = _defaultdict(_deque)
+    for phase in existing:
+        by_text[phase.text].append(phase)
+
+    targets = [None] * len(texts)
+    for idx, text in enumerate(texts):
+        if by_text[text]:
+            targets[idx] = by_text[text].popleft()
+    leftover = {phase.order: phase for phases in by_text.values() for phase in phases}
+    for idx, text in enumerate(texts):
+        if targets[idx] is None and (idx + 1) in leftover:
+            targets[idx] = leftover.pop(idx + 1)
+
+    if leftover:
+        TaskPhase.objects.filter(id__in=[phase.id for phase in leftover.values()]).delete()
+
+    changed, created = [], []
+    for idx, (text, phase) in enumerate(zip(texts, targets), start=1):
+        if phase is None:
+            created.append(TaskPhase(task=task, order=idx, text=text))
+        elif phase.order != idx or phase.text != text:
+            phase.order, phase.text = idx, text
+            changed.append(phase)
+
+    if changed:
+        # (task, order) فريد ويُفحص لكل صف: نزيح المراحل المتغيرة خارج النطاق أولًا
+        offset = max(p.order for p in existing) + len(texts) + 1
+        TaskPhase.objects.filter(id__in=[phase.id for phase in changed]).update(order=_F("order") + offset)
+        TaskPhase.objects.bulk_update(changed, ["order", "text"])
+    if created:
+        TaskPhase.objects.bulk_create(created)
+
+
+def _sync_recipients(task, user_ids, to_hr_team):
+    """يحذف المستلمين غير المطلوبين ويضيف الجدد فقط (الموجودون يبقون كما هم)."""
+    wanted_users = set(user_ids or [])
+    current = list(task.recipients.all())
+    removed = [
+        r.id for r in current
+        if (r.is_hr_team and not to_hr_team) or (not r.is_hr_team and r.user_id not in wanted_users)
+    ]
+    if removed:
+        TaskRecipient.objects.filter(id__in=removed).delete()
+
+    present_users = {r.user_id for r in current if not r.is_hr_team}
+    has_hr_team = any(r.is_hr_team for r in current)
+    added = _recipient_rows(
+        task,
+        [uid for uid in (user_ids or []) if uid not in present_users],
+        to_hr_team and not has_hr_team,
+    )
+    if added:
+        TaskRecipient.objects.bulk_create(added)
+
 class TaskPhaseSerializer(_s.ModelSerializer):
     class Meta:
         model = TaskPhase
@@ -163,16 +248,12 @@ class TaskSerializer(_s.ModelSerializer):
         recipient_user_ids = validated.pop("recipient_user_ids", [])
         to_hr_team = validated.pop("to_hr_team", False)
 
-        task = Task.objects.create(created_by=user, creator_role=creator_role, **validated)
-
-        for idx, text in enumerate(phase_texts, start=1):
-            TaskPhase.objects.create(task=task, order=idx, text=text)
-
-        for uid in recipient_user_ids:
-            TaskRecipient.objects.create(task=task, user_id=uid)
-        if to_hr_team:
-            TaskRecipient.objects.create(task=task, is_hr_team=True)
-
+        with _transaction.atomic():
+            task = Task.objects.create(created_by=user, creator_role=creator_role, **validated)
+            TaskPhase.objects.bulk_create(
+                [TaskPhase(task=task, order=idx, text=text) for idx, text in enumerate(phase_texts, start=1)]
+            )
+            TaskRecipient.objects.bulk_create(_recipient_rows(task, recipient_user_ids, to_hr_team))
         return task
 
     def update(self, instance, validated):
@@ -180,25 +261,56 @@ class TaskSerializer(_s.ModelSerializer):
         recipient_user_ids = validated.pop("recipient_user_ids", None)
         to_hr_team = validated.pop("to_hr_team", None)
 
-        for k, v in validated.items():
-            setattr(instance, k, v)
-        instance.save()
-
-        if phase_texts is not None:
-            instance.phases.all().delete()
-            for idx, text in enumerate(phase_texts, start=1):
-                TaskPhase.objects.create(task=instance, order=idx, text=text)
+        with _transaction.atomic():
+            for k, v in validated.items():
+                setattr(instance, k, v)
+            instance.save()
 
-        if (recipient_user_ids is not None) or (to_hr_team is not None):
-            instance.recipients.all().delete()
-            if recipient_user_ids:
-                for uid in recipient_user_ids:
-                    TaskRecipient.objects.create(task=instance, user_id=uid)
-            if to_hr_team:
-                TaskRecipient.objects.create(task=instance, is_hr_team=True)
+            if phase_texts is not None:
+                _sync_phases(instance, phase_texts)
+                instance.reset_progress()
 
+            if (recipient_user_ids is not None) or (to_hr_team is not None):
+                _sync_recipients(instance, recipient_user_ids, to_hr_team)
+                getattr(instance, "_prefetched_objects_cache", {}).pop("recipients", None)
         return instance
 
+    def to_representation(self, instance):
+        # بعد الإنشاء/التعديل (و DRF يفرغ الـ prefetch بعد update): 3 استعلامات بدل استعلام لكل مستلم
+        cache = getattr(instance, "_prefetched_objects_cache", {})
+        if "phases" not in cache or "recipients" not in cache:
+            _prefetch_related_objects([instance], "phases", "recipients__user")
+        return super().to_representation(instance)
+
+class TaskListSerializer(_s.ModelSerializer):
+    """
+    صف مختصر لقائمة المهام: العدادات والتقدم وملخص المستلمين من annotate في TaskViewSet.
+    context["expand"] يضيف الحقول المتداخلة الكاملة (phases / recipients).
+    """
+    EXPANDABLE = ("phases", "recipients")
+
+    total_phases = _s.IntegerField(read_only=True)
+    success_phases = _s.IntegerField(read_only=True)
+    progress_percent = _s.FloatField(read_only=True)
+    recipients_count = _s.IntegerField(source="recipient_total", read_only=True)
+    to_hr_team = _s.BooleanField(source="has_hr_team", read_only=True)
+    comments_count = _s.IntegerField(source="comment_total", read_only=True)
+
+    class Meta:
+        model = Task
+        fields = [
+            "id", "title", "creator_role", "created_by", "status", "created_at", "updated_at",
+            "total_phases", "success_phases", "progress_percent",
+            "recipients_count", "to_hr_team", "comments_count",
+        ]
+        read_only_fields = fields
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        nested = {"phases": TaskPhaseSerializer, "recipients": TaskRecipientSerializer}
+        for name in self.context.get("expand", ()):
+            self.fields[name] = nested[name](many=True, read_only=True)
+
 
 
 # ====================================
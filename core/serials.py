@@ -0,0 +1,69 @@
+"""Cluster-unique serial numbers for form stamps.
+
+A serial is a 19-digit decimal number laid out as::
+
+    <13-digit Unix time in ms><3-digit worker id><3-digit sequence>
+
+Uniqueness across processes and hosts comes from the worker id: either
+``STAMP_WORKER_ID`` or, when it is unset, the lowest id not held by a live
+``StampWorker`` row (claims expire after ``STAMP_WORKER_TTL`` without a
+heartbeat, so ids of stopped processes are reused). Inside a process every millisecond
+gets its own ``itertools.count`` created through ``dict.setdefault``. Both
+operations are atomic in CPython, so allocating a serial takes no lock.
+When a worker exhausts the 1000 sequences of a millisecond it moves on to
+the next one.
+"""
+import itertools
+import os
+import time
+from datetime import datetime
+
+WORKER_ID_LIMIT = 1000
+SEQUENCE_LIMIT = 1000
+
+# عدد المللي ثانية المحتفظ بعداداتها؛ الأقدم منها يُحذف عند تجاوز _PRUNE_AT
+_KEEP_MS = 5000
+_PRUNE_AT = 2048
+
+
+class SerialAllocator:
+    def __init__(self, worker_id: int):
+        if not 0 <= worker_id < WORKER_ID_LIMIT:
+            raise ValueError(f"worker_id must be in [0, {WORKER_ID_LIMIT - 1}]")
+        self.worker_id = worker_id
+        self.pid = os.getpid()
+        self._counters = {}
+        # ساعة monotonic مثبّتة على ساعة النظام عند الإنشاء: لا ترجع للخلف داخل العملية
+        self._wall_ms = time.time_ns() // 1_000_000
+        self._mono_ns = time.monotonic_ns()
+
+    def _now_ms(self) -> int:
+        return self._wall_ms + (time.monotonic_ns() - self._mono_ns) // 1_000_000
+
+    def _prune(self, now_ms: int) -> None:
+        for ms in list(self._counters):
+            if ms < now_ms - _KEEP_MS:
+                self._counters.pop(ms, None)
+
+    def next(self) -> int:
+        ms = self._now_ms()
+        while True:
+            counter = self._counters.get(ms)
+            if counter is None:
+                counter = self._counters.setdefault(ms, itertools.count())
+                if len(self._counters) > _PRUNE_AT:
+                    self._prune(ms)
+            seq = next(counter)
+            if seq < SEQUENCE_LIMIT:
+                return (ms * WORKER_ID_LIMIT + self.worker_id) * SEQUENCE_LIMIT + seq
+            ms += 1
+
+
+def serial_datetime(serial: int) -> datetime:
+    """Local time encoded in a serial (millisecond precision)."""
+    ms = serial // (WORKER_ID_LIMIT * SEQUENCE_LIMIT)
+    return datetime.fromtimestamp(ms / 1000)
+
+
+def serial_worker_id(serial: int) -> int:
+    return serial // SEQUENCE_LIMIT % WORKER_ID_LIMIT
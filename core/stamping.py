@@ -0,0 +1,439 @@
+"""PDF stamping helpers used by ``preview_form``.
+
+The stamp overlay only depends on the page size and on the text width, so
+its reportlab rendering is done once per ``(width, height, text width)`` and
+kept as a pre-parsed template; each request only swaps the text literal in
+the template content stream.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from io import BytesIO
+
+from PyPDF2 import PdfReader, PdfWriter, PageObject
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject, StreamObject
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.units import mm
+
+STAMP_FONT = "Helvetica"
+STAMP_FONT_SIZE = 9
+STAMP_GRAY = 0.35
+STAMP_MARGIN_X = 12 * mm
+STAMP_MARGIN_Y = 4 * mm   # أقرب للحافة السفلية
+
+_PLACEHOLDER = b"(@@STAMP@@)"
+
+
+def _pdf_literal(text: str) -> bytes:
+    escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return b"(" + escaped.encode("latin-1", "replace") + b")"
+
+
+@lru_cache(maxsize=64)
+def _overlay_template(page_width: float, page_height: float, text_width: float):
+    """Render the stamp once with a placeholder and keep the parsed page."""
+    buf = BytesIO()
+    c = canvas.Canvas(buf, pagesize=(page_width, page_height), pageCompression=0)
+    c.setFont(STAMP_FONT, STAMP_FONT_SIZE)
+    c.setFillGray(STAMP_GRAY)
+    # نفس موضع drawRightString لكن بعرض النص الحقيقي وليس عرض العلامة
+    c.drawString(page_width - STAMP_MARGIN_X - text_width, STAMP_MARGIN_Y, _PLACEHOLDER[1:-1].decode())
+    c.save()
+    buf.seek(0)
+    page = PdfReader(buf).pages[0]
+    content = page["/Contents"].get_object().get_data()
+    if _PLACEHOLDER not in content:
+        raise ValueError("Stamp placeholder not found in overlay content")
+    resources = page["/Resources"].get_object()
+    # نحلّ كائنات الخط الآن حتى لا يُقرأ القالب المشترك من عدة خيوط لاحقًا
+    for ref in resources["/Font"].get_object().values():
+        ref.get_object()
+    return resources, content
+
+
+def overlay_page(page_width: float, page_height: float, text: str) -> PageObject:
+    """Return a one-page overlay drawing ``text`` bottom-right on the page."""
+    width = round(stringWidth(text, STAMP_FONT, STAMP_FONT_SIZE), 3)
+    resources, content = _overlay_template(round(page_width, 3), round(page_height, 3), width)
+
+    stream = DecodedStreamObject()
+    stream.set_data(content.replace(_PLACEHOLDER, _pdf_literal(text)))
+    page = PageObject.create_blank_page(width=page_width, height=page_height)
+    page[NameObject("/Resources")] = resources
+    page[NameObject("/Contents")] = stream
+    return page
+
+
+def stamp_pdf(src, dst, text: str) -> None:
+    """Merge the stamp into every page of ``src`` and write the result to ``dst``.
+
+    One overlay is built per distinct mediabox size, so the cost follows the
+    number of page sizes rather than the number of pages.
+    """
+    reader = PdfReader(src)
+    writer = PdfWriter()
+    overlays = {}
+
+    for page in reader.pages:
+        size = (float(page.mediabox.width), float(page.mediabox.height))
+        layer = overlays.get(size)
+        if layer is None:
+            layer = overlays[size] = overlay_page(size[0], size[1], text)
+        page.merge_page(layer)
+        writer.add_page(page)
+
+    writer.write(dst)
+
+
+# =========================
+# Incremental-update engine
+# =========================
+# بدل إعادة كتابة الملف كاملًا، نترك بايتات الملف الأصلي كما هي ونلحق بها
+# قسم تحديث (incremental update): كائن XObject للختم + نسخ معدّلة من كائنات
+# الصفحات + xref جديد يشير إلى السابق عبر /Prev.
+
+class IncrementalUpdateUnsupported(Exception):
+    """The PDF cannot be stamped by appending an update section."""
+
+
+_STAMP_XOBJECT = "/FormStamp"
+_TAIL_PROBE = 2048
+
+
+def _serialize(obj) -> bytes:
+    buf = BytesIO()
+    obj.write_to_stream(buf, None)
+    return buf.getvalue()
+
+
+def _serialize_entries(dictionary, exclude=()) -> str:
+    parts = []
+    for key, value in dictionary.items():
+        if key in exclude:
+            continue
+        parts.append(_serialize(NameObject(key)) + b" " + _serialize(value))
+    return b" ".join(parts).decode("latin-1")
+
+
+def _find_startxref(stream, file_size: int) -> int:
+    stream.seek(max(0, file_size - _TAIL_PROBE))
+    tail = stream.read()
+    pos = tail.rfind(b"startxref")
+    if pos < 0:
+        raise IncrementalUpdateUnsupported("startxref not found")
+    try:
+        return int(tail[pos + len(b"startxref"):].split()[0])
+    except (IndexError, ValueError):
+        raise IncrementalUpdateUnsupported("Invalid startxref")
+
+
+def describe_pdf(stream) -> dict:
+    """Collect the structure of a PDF file object as a JSON-serialisable dict.
+
+    Only the trailer, the xref and the page dictionaries are parsed; content
+    streams are never decoded. Page count and sizes are always filled in; the
+    serialized page entries needed by :func:`incremental_update` only when
+    ``layout["incremental"]`` is true.
+    """
+    stream.seek(0, 2)
+    file_size = stream.tell()
+    startxref = _find_startxref(stream, file_size)
+    stream.seek(startxref)
+    classic_xref = stream.read(4) == b"xref"
+    stream.seek(max(0, file_size - 2))
+    ends_with_eol = stream.read(2)[-1:] in (b"\n", b"\r")
+
+    stream.seek(0)
+    reader = PdfReader(stream)
+    trailer = reader.trailer
+    layout = {
+        "version": reader.pdf_header,
+        "size": file_size,
+        "startxref": startxref,
+        "classic_xref": classic_xref,
+        "ends_with_eol": ends_with_eol,
+        "encrypted": reader.is_encrypted,
+        "incremental": classic_xref and not reader.is_encrypted,
+        "xref_size": int(trailer.get("/Size", 0)),
+        "root": _serialize(trailer.raw_get("/Root")).decode("latin-1") if "/Root" in trailer else None,
+        "info": _serialize(trailer.raw_get("/Info")).decode("latin-1") if "/Info" in trailer else None,
+        "id": _serialize(trailer["/ID"]).decode("latin-1") if "/ID" in trailer else None,
+        "page_count": None,
+        "pages": [],
+    }
+    if reader.is_encrypted:
+        # ملفات محمية بكلمة مرور للمالك فقط تُفتح بكلمة فارغة
+        try:
+            reader.decrypt("")
+        except Exception:
+            return layout
+
+    offsets = {}
+    for gen_offsets in reader.xref.values():
+        offsets.update(gen_offsets)
+
+    used_names = set()
+    for page in reader.pages:
+        ref = page.indirect_ref
+        box = page.mediabox
+        info = {
+            "ref": [ref.idnum, ref.generation] if ref is not None else None,
+            "offset": offsets.get(ref.idnum) if ref is not None else None,
+            "mediabox": [float(box.left), float(box.bottom), float(box.right), float(box.top)],
+        }
+        layout["pages"].append(info)
+        if not layout["incremental"]:
+            continue
+        if ref is None:
+            layout["incremental"] = False
+            continue
+
+        contents = page.raw_get("/Contents") if "/Contents" in page else None
+        if contents is not None and not isinstance(contents.get_object(), StreamObject):
+            # مصفوفة (مباشرة أو غير مباشرة) من تدفقات المحتوى
+            contents = contents.get_object()
+            contents = " ".join(_serialize(item).decode("latin-1") for item in contents)
+        elif contents is not None:
+            contents = _serialize(contents).decode("latin-1")
+
+        resources = page["/Resources"].get_object() if "/Resources" in page else DictionaryObject()
+        xobjects = resources["/XObject"].get_object() if "/XObject" in resources else DictionaryObject()
+        used_names.update(xobjects.keys())
+
+        info.update({
+            "dict": _serialize_entries(page, exclude=("/Contents", "/Resources")),
+            "contents": contents,
+            "resources": _serialize_entries(resources, exclude=("/XObject",)),
+            "xobjects": _serialize_entries(xobjects),
+        })
+    layout["page_count"] = len(layout["pages"])
+
+    # اسم للـ XObject لا يتعارض مع أسماء الصفحات (الملف قد يكون مختومًا سابقًا)
+    name, n = _STAMP_XOBJECT, 0
+    while name in used_names:
+        n += 1
+        name = f"{_STAMP_XOBJECT}{n}"
+    layout["stamp_name"] = name
+    return layout
+
+
+def _stamp_stream(mediabox, text: str) -> bytes:
+    left, bottom, right, _top = mediabox
+    x = right - STAMP_MARGIN_X - stringWidth(text, STAMP_FONT, STAMP_FONT_SIZE)
+    y = bottom + STAMP_MARGIN_Y
+    return (
+        b"q %g g BT /F1 %d Tf 1 0 0 1 %.3f %.3f Tm %s Tj ET Q"
+        % (STAMP_GRAY, STAMP_FONT_SIZE, x, y, _pdf_literal(text))
+    )
+
+
+def incremental_update(layout: dict, text: str) -> bytes:
+    """Build the bytes to append to the original file to stamp every page."""
+    if not layout.get("incremental") or not layout["pages"] or not layout["root"]:
+        raise IncrementalUpdateUnsupported("Unsupported PDF structure")
+
+    body = BytesIO()
+    if not layout["ends_with_eol"]:
+        body.write(b"\n")
+    base = layout["size"]
+    offsets = {}
+    next_num = layout["xref_size"]
+
+    def write_object(num, gen, payload: bytes, stream: bytes = None):
+        offsets[num] = (base + body.tell(), gen)
+        body.write(b"%d %d obj\n" % (num, gen))
+        if stream is None:
+            body.write(payload)
+        else:
+            body.write(payload[:-2] + b" /Length %d >>\nstream\n" % len(stream))
+            body.write(stream)
+            body.write(b"\nendstream")
+        body.write(b"\nendobj\n")
+
+    def alloc():
+        nonlocal next_num
+        next_num += 1
+        return next_num - 1
+
+    font = alloc()
+    write_object(font, 0, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    push = alloc()
+    write_object(push, 0, b"<< >>", b"q\n")
+    pop_and_stamp = alloc()
+    stamp_name = layout["stamp_name"]
+    write_object(pop_and_stamp, 0, b"<< >>", b"\nQ q %s Do Q\n" % stamp_name.encode())
+
+    overlays = {}
+    for page in layout["pages"]:
+        box = tuple(page["mediabox"])
+        xobject = overlays.get(box)
+        if xobject is None:
+            xobject = overlays[box] = alloc()
+            write_object(
+                xobject, 0,
+                b"<< /Type /XObject /Subtype /Form /BBox [%.3f %.3f %.3f %.3f] "
+                b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (box + (font,)),
+                _stamp_stream(box, text),
+            )
+
+        num, gen = page["ref"]
+        contents = " ".join(filter(None, [f"{push} 0 R", page["contents"], f"{pop_and_stamp} 0 R"]))
+        write_object(num, gen, (
+            f"<< {page['dict']} /Contents [{contents}] "
+            f"/Resources << {page['resources']} /XObject << {page['xobjects']} {stamp_name} {xobject} 0 R >> >> >>"
+        ).encode("latin-1"))
+
+    xref_at = base + body.tell()
+    body.write(b"xref\n")
+    # كل قسم xref يبدأ بالكائن 0 (رأس قائمة الكائنات الحرة) وإلا يعدّه القارئ غير مفهرس من الصفر
+    body.write(b"0 1\n0000000000 65535 f\r\n")
+    numbers = sorted(offsets)
+    start = 0
+    while start < len(numbers):
+        end = start
+        while end + 1 < len(numbers) and numbers[end + 1] == numbers[end] + 1:
+            end += 1
+        body.write(b"%d %d\n" % (numbers[start], end - start + 1))
+        for num in numbers[start:end + 1]:
+            offset, gen = offsets[num]
+            body.write(b"%010d %05d n\r\n" % (offset, gen))
+        start = end + 1
+
+    trailer = f"/Size {next_num} /Root {layout['root']} /Prev {layout['startxref']}"
+    if layout["info"]:
+        trailer += f" /Info {layout['info']}"
+    if layout["id"]:
+        trailer += f" /ID {layout['id']}"
+    body.write(f"trailer\n<< {trailer} >>\nstartxref\n{xref_at}\n%%EOF\n".encode("latin-1"))
+    return body.getvalue()
+
+
+# =========================
+# Process pool backend
+# =========================
+# مسار إعادة الكتابة عمل CPU بحت؛ تشغيله في عمليات منفصلة يحرر عامل الويب
+# ويمنع دفعة تحميلات من تجويع بقية الطلبات. السعة محدودة (workers + queue_depth)
+# وأي طلب زائد يُرفض فورًا بدل أن ينتظر (إلا ملفات ZIP: تنتظر دورها حتى المهلة).
+
+class StampQueueFull(Exception):
+    """All pool workers are busy and the waiting queue is full."""
+
+
+def _stamp_file_job(src_path: str, text: str) -> str:
+    fd, dst_path = tempfile.mkstemp(prefix="stamped-", suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as dst, open(src_path, "rb") as src:
+            stamp_pdf(src, dst, text)
+    except BaseException:
+        os.unlink(dst_path)
+        raise
+    return dst_path
+
+
+def _discard_result(future) -> None:
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        os.unlink(future.result())
+    except OSError:
+        pass
+
+
+class StampPool:
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: لا ننسخ عملية Django (وخيوطها واتصالاتها) داخل العمال
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def _reset(self, executor) -> None:
+        with self._lock:
+            if executor is None or self._executor is not executor:
+                return
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _terminate(self, executor) -> None:
+        """Kill the workers of ``executor`` and route new jobs to a fresh one.
+
+        A hung job never gives back its worker or its slot otherwise. Jobs
+        still running on ``executor`` fail with ``BrokenProcessPool``, which
+        releases their slots too.
+        """
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        self._reset(executor)
+        for process in processes:
+            process.terminate()
+
+    def _submit(self, src_path: str, text: str, wait: float):
+        acquired = self._slots.acquire(timeout=wait) if wait > 0 else self._slots.acquire(blocking=False)
+        if not acquired:
+            raise StampQueueFull()
+        executor = self._get_executor()
+        try:
+            future = executor.submit(_stamp_file_job, src_path, text)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset(executor)
+            raise
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _f: self._slots.release())
+        return future, executor
+
+    def submit(self, src_path: str, text: str, wait: float = 0):
+        """Queue a rewrite-stamp of ``src_path``; the future resolves to a temp file path.
+
+        ``wait`` is how long to wait for a free slot before ``StampQueueFull``.
+        """
+        return self._submit(src_path, text, wait)[0]
+
+    def stamp(self, src_path: str, text: str, timeout: float, wait: float = 0) -> str:
+        """Stamp through the pool and wait up to ``timeout`` seconds.
+
+        Raises ``StampQueueFull`` or ``TimeoutError``; the caller owns (and must
+        delete) the returned file. A job still running at the deadline is
+        killed together with its executor's workers, so it cannot hold a
+        worker and a slot for good.
+        """
+        future, executor = self._submit(src_path, text, wait)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            if not future.cancel():
+                future.add_done_callback(_discard_result)
+                if not future.done():
+                    self._terminate(executor)
+            raise
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise
+
+
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_stamp_pool(workers: int, queue_depth: int) -> StampPool:
+    key = (workers, queue_depth)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = _POOLS[key] = StampPool(workers, queue_depth)
+        return pool
@@ -1,3 +1,948 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import multiprocessing
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PyPDF2 import PdfReader
+from reportlab.pdfgen import canvas
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.models import (
+    Complaint, CustomUser, FormModel, Notification, NotificationReadWatermark, Section, StampWorker, Survey, Task,
+    TaskComment, TaskPhase, TaskRecipient, UnreadCounter, UserNotification, UserSectionPermission,
+)
+from core.serials import SerialAllocator, serial_datetime, serial_worker_id
+from core.stamping import describe_pdf, incremental_update
+
+
+def _allocate_serials(worker_id, n):
+    allocator = SerialAllocator(worker_id)
+    return [allocator.next() for _ in range(n)]
+
+
+class SerialAllocatorTests(SimpleTestCase):
+    def test_layout(self):
+        serial = SerialAllocator(42).next()
+        self.assertEqual(len(str(serial)), 19)
+        self.assertEqual(serial_worker_id(serial), 42)
+        self.assertLess(abs(serial_datetime(serial).timestamp() - time.time()), 5)
+
+    def test_invalid_worker_id(self):
+        with self.assertRaises(ValueError):
+            SerialAllocator(1000)
+        with self.assertRaises(ValueError):
+            SerialAllocator(-1)
+
+    def test_increasing_within_thread(self):
+        serials = _allocate_serials(1, 5000)
+        self.assertEqual(serials, sorted(serials))
+        self.assertEqual(len(set(serials)), len(serials))
+
+    def test_sequence_rolls_over_to_next_ms(self):
+        allocator = SerialAllocator(7)
+        with mock.patch.object(allocator, '_now_ms', return_value=1_700_000_000_000):
+            serials = [allocator.next() for _ in range(2500)]
+        self.assertEqual(len(set(serials)), 2500)
+        self.assertEqual({s // 1_000_000 for s in serials},
+                         {1_700_000_000_000, 1_700_000_000_001, 1_700_000_000_002})
+
+    def test_unique_across_threads(self):
+        allocator = SerialAllocator(3)
+        results = [[] for _ in range(16)]
+        barrier = threading.Barrier(len(results))
+
+        def work(out):
+            barrier.wait()
+            for _ in range(5000):
+                out.append(allocator.next())
+
+        threads = [threading.Thread(target=work, args=(out,)) for out in results]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        serials = [s for out in results for s in out]
+        self.assertEqual(len(set(serials)), 16 * 5000)
+
+    @override_settings(STAMP_WORKER_ID='9')
+    def test_one_allocator_per_process(self):
+        from core import views
+
+        def slow_allocator(worker_id):
+            time.sleep(0.01)  # يوسّع نافذة السباق على أول استخدام
+            return SerialAllocator(worker_id)
+
+        allocators = []
+        barrier = threading.Barrier(8)
+
+        def first_use():
+            barrier.wait()
+            allocators.append(views._serial_allocator())
+
+        with mock.patch.object(views, '_SERIALS', None), \
+                mock.patch.object(views, 'SerialAllocator', side_effect=slow_allocator):
+            threads = [threading.Thread(target=first_use) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(len({id(a) for a in allocators}), 1)
+
+    @skipUnless('fork' in multiprocessing.get_all_start_methods(), 'needs fork')
+    def test_unique_across_processes(self):
+        # fork: العمال لا يعيدون استيراد core.tests، فالاختبار لا يعتمد على ما تستورده الوحدة
+        ctx = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=4, mp_context=ctx) as pool:
+            batches = list(pool.map(_allocate_serials, range(4), [20000] * 4))
+        serials = [s for batch in batches for s in batch]
+        self.assertEqual(len(set(serials)), len(serials))
+
+    def test_throughput(self):
+        allocator = SerialAllocator(5)
+        start = time.perf_counter()
+        for _ in range(100000):
+            allocator.next()
+        # تحقق تقريبي فقط: بدون قفل يجب أن يتجاوز بسهولة 100 ألف رقم في الثانية
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+
+class DefaultWorkerIdTests(TestCase):
+    """المسار الافتراضي: بدون STAMP_WORKER_ID تحجز كل عملية رقمها من قاعدة البيانات."""
+
+    def test_processes_on_one_host_get_distinct_ids(self):
+        worker_ids = []
+        for pid in range(1000, 1300):
+            with mock.patch('os.getpid', return_value=pid):
+                worker_ids.append(StampWorker.claim().worker_id)
+        self.assertEqual(worker_ids, list(range(300)))
+
+    def test_lowest_free_id_is_reused(self):
+        workers = [StampWorker.claim() for _ in range(5)]
+        workers[2].delete()
+        self.assertEqual(StampWorker.claim().worker_id, 2)
+        self.assertEqual(StampWorker.claim().worker_id, 5)
+
+    @override_settings(STAMP_WORKER_TTL=60)
+    def test_expired_claims_are_released(self):
+        stale, live = StampWorker.claim(), StampWorker.claim()
+        StampWorker.objects.filter(pk=stale.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(StampWorker.claim().worker_id, stale.worker_id)
+        self.assertFalse(StampWorker.objects.filter(pk=stale.pk).exists())
+        self.assertFalse(stale.beat())
+        self.assertTrue(live.beat())
+
+    def test_live_ids_are_never_handed_out_twice(self):
+        StampWorker.objects.bulk_create(
+            StampWorker(worker_id=i, hostname='h', pid=i) for i in range(1000)
+        )
+        with self.assertRaises(RuntimeError):
+            StampWorker.claim()
+
+    @override_settings(STAMP_WORKER_ID=None, STAMP_WORKER_TTL=60)
+    def test_allocator_reclaims_after_its_claim_expired(self):
+        from core import views
+
+        with mock.patch.object(views, '_SERIALS', None), mock.patch.object(views, '_SERIAL_WORKER', None):
+            first = views._serial_allocator()
+            worker = views._SERIAL_WORKER
+            # تجديد الحجز عند مرور ثلث المدة دون تغيير الرقم
+            StampWorker.objects.filter(pk=worker.pk).update(heartbeat_at=timezone.now() - timedelta(seconds=30))
+            worker.heartbeat_at = timezone.now() - timedelta(seconds=30)
+            self.assertIs(views._serial_allocator(), first)
+            self.assertGreater(StampWorker.objects.get(pk=worker.pk).heartbeat_at, timezone.now() - timedelta(seconds=5))
+
+            # انتهى الحجز وأخذت عملية أخرى الرقم: يُحجز رقم جديد
+            worker.heartbeat_at = timezone.now() - timedelta(seconds=61)
+            StampWorker.objects.filter(pk=worker.pk).update(heartbeat_at=worker.heartbeat_at)
+            with mock.patch('os.getpid', return_value=99999):
+                other = StampWorker.claim()
+            self.assertEqual(other.worker_id, worker.worker_id)
+            second = views._serial_allocator()
+            self.assertIsNot(second, first)
+            self.assertNotEqual(views._SERIAL_WORKER.worker_id, other.worker_id)
+            self.assertEqual(serial_worker_id(second.next()), views._SERIAL_WORKER.worker_id)
+
+    @override_settings(STAMP_WORKER_ID=None)
+    def test_default_allocators_do_not_collide(self):
+        from core import views
+
+        serials = []
+        for pid in range(2000, 2050):
+            # كل "عملية" تنشئ مولّدها عبر المسار الافتراضي في نفس المللي ثانية
+            with mock.patch('os.getpid', return_value=pid), mock.patch.object(views, '_SERIALS', None):
+                allocator = views._serial_allocator()
+                with mock.patch.object(allocator, '_now_ms', return_value=1_700_000_000_000):
+                    serials.extend(allocator.next() for _ in range(100))
+        self.assertEqual(len(set(serials)), len(serials))
+
+
+class ComplaintQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hr = CustomUser.objects.create_user(username='hr', password='x', role='hr')
+        cls.manager = CustomUser.objects.create_user(username='manager', password='x', role='manager')
+        cls.employees = [
+            CustomUser.objects.create_user(username=f'employee{i}', password='x', role='employee')
+            for i in range(5)
+        ]
+        for i, employee in enumerate(cls.employees):
+            for recipient_type in ('hr', 'manager'):
+                Complaint.objects.create(
+                    sender=employee, recipient_type=recipient_type, title=f't{i}', message='m',
+                    is_responded=True, response='r', responded_by=cls.hr,
+                )
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_inbox_lists_do_not_query_per_complaint(self):
+        # COUNT للترقيم + استعلام الصفحة مع sender و responded_by
+        for user, url, expected in (
+            (self.hr, '/api/complaints/hr_complaints/', 5),
+            (self.manager, '/api/complaints/manager_complaints/', 5),
+            (self.employees[0], '/api/complaints/my_complaints/', 2),
+        ):
+            client = self.client_for(user)
+            with self.assertNumQueries(2):
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), expected)
+            self.assertTrue(all(item['sender_username'] for item in response.data['results']))
+
+    def test_has_unread_is_a_single_query(self):
+        for user in (self.hr, self.manager, self.employees[0]):
+            client = self.client_for(user)
+            with self.assertNumQueries(1):
+                response = client.get('/api/complaints/has_unread/')
+            self.assertTrue(response.data['has_new'])
+
+
+class TaskListQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hr = CustomUser.objects.create_user(username='hr', password='x', role='hr')
+        cls.employees = [
+            CustomUser.objects.create_user(username=f'employee{i}', password='x', role='employee')
+            for i in range(2)
+        ]
+
+    def create_tasks(self, n):
+        for i in range(n):
+            task = Task.objects.create(title=f't{i}', creator_role='hr', created_by=self.hr)
+            for order in range(1, 5):
+                status = 'success' if order <= i % 5 else 'pending'
+                TaskPhase.objects.create(task=task, order=order, text='p', status=status)
+            for employee in self.employees:
+                TaskRecipient.objects.create(task=task, user=employee)
+            TaskRecipient.objects.create(task=task, is_hr_team=True)
+
+    def list_tasks(self, user, query='', queries=2):
+        client = APIClient()
+        client.force_authenticate(user)
+        # COUNT للترقيم + الصفحة مع العدادات (+ prefetch لكل حقل في expand)
+        with self.assertNumQueries(queries):
+            response = client.get(f'/api/tasks/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_progress_does_not_query_per_task(self):
+        self.create_tasks(2)
+        for user in (self.hr, self.employees[0]):
+            self.assertEqual(len(self.list_tasks(user)), 2)
+
+        self.create_tasks(8)
+        for user in (self.hr, self.employees[0]):
+            results = self.list_tasks(user)
+            self.assertEqual(len(results), 10)
+            expected = {task.id: task.progress_percent for task in Task.objects.all()}
+            self.assertEqual({item['id']: item['progress_percent'] for item in results}, expected)
+            self.assertTrue(all(item['recipients_count'] == 2 and item['to_hr_team'] for item in results))
+
+    def test_expand_adds_nested_fields(self):
+        self.create_tasks(3)
+        # phases + recipients + users
+        results = self.list_tasks(self.hr, '?expand=phases,recipients', queries=5)
+        self.assertTrue(all(len(item['phases']) == 4 and len(item['recipients']) == 3 for item in results))
+        self.assertNotIn('phases', self.list_tasks(self.hr)[0])
+
+
+class TaskUpdateSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hr = CustomUser.objects.create_user(username='hr', password='x', role='hr')
+        cls.employees = [
+            CustomUser.objects.create_user(username=f'employee{i}', password='x', role='employee')
+            for i in range(3)
+        ]
+
+    def create_task(self, phases):
+        task = Task.objects.create(title='t', creator_role='hr', created_by=self.hr)
+        for order in range(1, phases + 1):
+            TaskPhase.objects.create(task=task, order=order, text=f'p{order}')
+        task.phases.get(order=1).complete('success')
+        for employee in self.employees[:2]:
+            TaskRecipient.objects.create(task=task, user=employee)
+        TaskRecipient.objects.create(task=task, is_hr_team=True)
+        return task
+
+    def update(self, task, phase_texts, queries):
+        client = APIClient()
+        client.force_authenticate(self.hr)
+        data = {
+            'phase_texts': phase_texts,
+            'recipient_user_ids': [self.employees[0].id, self.employees[2].id],
+            'to_hr_team': True,
+        }
+        with self.assertNumQueries(queries):
+            response = client.patch(f'/api/tasks/{task.id}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_update_keeps_completed_phases_and_unchanged_recipients(self):
+        task = self.create_task(3)
+        completed = task.phases.get(order=1)
+        kept = set(task.recipients.exclude(user=self.employees[1]).values_list('id', flat=True))
+
+        # المهمة + prefetch (3) + UPDATE المهمة + إزاحة وتحديث المراحل + INSERT
+        # + حذف/إضافة مستلم + إعادة الجلب للعرض (3) + savepoint (2)
+        data = self.update(task, ['p1', 'new', 'p2', 'p3'], queries=15)
+
+        self.assertEqual([phase['text'] for phase in data['phases']], ['p1', 'new', 'p2', 'p3'])
+        phase = task.phases.get(order=1)
+        self.assertEqual((phase.id, phase.status, phase.completed_at), (completed.id, 'success', completed.completed_at))
+        self.assertEqual(data['progress_percent'], 25.0)
+        recipients = {r.id: r.user_id for r in task.recipients.all()}
+        self.assertTrue(kept <= set(recipients))
+        self.assertEqual(
+            sorted(filter(None, recipients.values())), [self.employees[0].id, self.employees[2].id]
+        )
+
+    def test_query_count_does_not_grow_with_phases(self):
+        for phases in (3, 30):
+            task = self.create_task(phases)
+            texts = [f'p{order}' for order in range(1, phases + 1)]
+            texts.insert(1, 'new')
+            del texts[-1]
+            # كما سبق + DELETE للمرحلة الأخيرة المحذوفة، مهما كان عدد المراحل
+            data = self.update(task, texts, queries=16)
+            self.assertEqual(len(data['phases']), phases)
+
+
+class TaskCommentThreadTests(TestCase):
+    def setUp(self):
+        self.hr = CustomUser.objects.create_user(username='hr', password='x', role='hr')
+        self.task = Task.objects.create(title='t', creator_role='hr', created_by=self.hr)
+        self.comments = [TaskComment.objects.create(task=self.task, author=self.hr, text=f'c{i}') for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.hr)
+        self.url = f'/api/tasks/{self.task.id}/comments/'
+
+    def test_etag_depends_on_the_page_window(self):
+        first = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual([c['text'] for c in first.data['results']], ['c0', 'c1'])
+        etag = first['ETag']
+
+        self.assertEqual(self.client.get(self.url, {'page_size': 2}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        second = self.client.get(first.data['next'], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual([c['text'] for c in second.data['results']], ['c2', 'c3'])
+
+        etags = {etag, second['ETag']}
+        for params in ({}, {'page_size': 3}, {'since': self.comments[0].id, 'page_size': 2}):
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, params)
+            etags.add(response['ETag'])
+        self.assertEqual(len(etags), 5)
+
+    def test_new_comment_changes_etag(self):
+        etag = self.client.get(self.url, {'since': self.comments[-1].id})['ETag']
+        TaskComment.objects.create(task=self.task, author=self.hr, text='new')
+        response = self.client.get(self.url, {'since': self.comments[-1].id}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['text'] for c in response.data['results']], ['new'])
+
+
+class CompleteNextPhaseConcurrencyTests(TransactionTestCase):
+    phases = 5
+    clicks = 20
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and (
+            connection.is_in_memory_db()
+            or connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE'
+        ):
+            # SQLite يرفض الكاتب المتزامن (database is locked) بدل انتظاره إلا مع ملف و BEGIN IMMEDIATE
+            self.skipTest('needs a database that serialises concurrent writers')
+        self.hr = CustomUser.objects.create_user(username='hr', password='x', role='hr')
+        self.employee = CustomUser.objects.create_user(username='employee', password='x', role='employee')
+        self.task = Task.objects.create(title='t', creator_role='hr', created_by=self.hr)
+        for order in range(1, self.phases + 1):
+            TaskPhase.objects.create(task=self.task, order=order, text=f'p{order}')
+        TaskRecipient.objects.create(task=self.task, user=self.employee)
+
+    def test_concurrent_clicks_complete_each_phase_once(self):
+        barrier = threading.Barrier(self.clicks)
+        responses = []
+
+        def click():
+            client = APIClient()
+            client.force_authenticate(self.employee)
+            try:
+                barrier.wait()
+                response = client.post(
+                    f'/api/tasks/{self.task.id}/complete-next-phase/',
+                    {'result': 'success', 'auto_close': True}, format='json',
+                )
+                responses.append((response.status_code, response.data))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=click) for _ in range(self.clicks)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        completed = [data for status, data in responses if status == 200]
+        self.assertEqual(len(completed), self.phases)
+        self.assertEqual(sorted(data['order'] for data in completed), list(range(1, self.phases + 1)))
+        self.assertTrue(all(status in (200, 400, 409) for status, _ in responses))
+        self.assertEqual(max(data['progress_percent'] for data in completed), 100.0)
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'success')
+        self.assertFalse(self.task.phases.exclude(status='success').exists())
+        self.assertFalse(self.task.phases.filter(completed_at__isnull=True).exists())
+
+
+class ComplaintSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hr = CustomUser.objects.create_user(username='hr', password='x', role='hr')
+        employee = CustomUser.objects.create_user(username='employee', password='x', role='employee')
+        for title in ('الإدارة لا ترد', 'تأخر صرف الراتب'):
+            Complaint.objects.create(sender=employee, recipient_type='hr', title=title, message='نص الشكوى')
+
+    def search(self, query):
+        client = APIClient()
+        client.force_authenticate(self.hr)
+        return client.get('/api/complaints/search/', {'q': query})
+
+    def test_normalised_prefix_match(self):
+        response = self.search('اداره')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['title'] for item in response.data['results']], ['الإدارة لا ترد'])
+
+    def test_query_without_tokens_returns_empty_page(self):
+        for query in ('"', '!!! ؟', '*'):
+            response = self.search(query)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['results'], [])
+            self.assertEqual(response.data['count'], 0)
+
+
+class GlobalNotificationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='employee', password='x', role='employee')
+        self.notification = Notification.objects.create(title='عام', message='للجميع', is_global=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def inbox(self):
+        return self.client.get('/api/user-notifications/').data['results']
+
+    def test_global_item_is_addressed_by_notification_id(self):
+        [item] = self.inbox()
+        self.assertIsNone(item['id'])
+        self.assertEqual(item['notification']['id'], self.notification.id)
+        self.assertEqual(self.client.get('/api/unread-counts/').data['notifications'], 1)
+
+        response = self.client.post(f'/api/user-notifications/global/{self.notification.id}/delete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.inbox(), [])
+        self.assertEqual(self.client.get('/api/unread-counts/').data['notifications'], 0)
+
+    def test_crud_route_cannot_create_global(self):
+        response = self.client.post('/api/notifications/', {'title': 't', 'message': 'm', 'is_global': True})
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(Notification.objects.get(pk=response.data['id']).is_global)
+
+    def test_delete_unknown_global(self):
+        response = self.client.post(f'/api/user-notifications/global/{self.notification.id + 1}/delete/')
+        self.assertEqual(response.status_code, 404)
+
+
+class InboxTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.alice = CustomUser.objects.create_user(
+            username='alice', password='x', role='employee', date_joined=self.now - timedelta(days=1)
+        )
+        self.bob = CustomUser.objects.create_user(
+            username='bob', password='x', role='employee', date_joined=self.now - timedelta(days=1)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.alice)
+
+    def notify(self, minutes, users=(), is_global=False, **row):
+        created_at = self.now - timedelta(minutes=minutes)
+        notification = Notification.objects.create(title='t', message='m', is_global=is_global)
+        Notification.objects.filter(pk=notification.pk).update(created_at=created_at)
+        notification.created_at = created_at
+        for user in users:
+            UserNotification.objects.create(user=user, notification=notification, **row)
+        return notification
+
+    def row_id(self, notification, user=None):
+        return UserNotification.objects.get(user=user or self.alice, notification=notification).id
+
+    def feed(self, client=None):
+        response = (client or self.client).get('/api/user-notifications/?page_size=100')
+        return {item['notification']['id']: item['is_read'] for item in response.data['results']}
+
+
+class NotificationFeedTests(InboxTestCase):
+    """صندوق الإشعارات بالمؤشر: موجّهة + عامة، مع أوقات إنشاء متساوية."""
+
+    def walk(self, page_size):
+        ids, url = [], f'/api/user-notifications/?page_size={page_size}'
+        while url:
+            self.assertLess(len(ids), 100, 'cursor does not advance')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), page_size)
+            ids += [item['notification']['id'] for item in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_feed_once_in_order(self):
+        tied = [self.notify(10, users=[self.alice, self.bob]) for _ in range(4)]
+        tied += [self.notify(10, is_global=True) for _ in range(3)]
+        newer = [self.notify(5, users=[self.alice]), self.notify(1, is_global=True)]
+        older = [self.notify(20, users=[self.alice], is_read=True)]
+        # لا تظهر: موجّه لغيرها، مخفي، عام قبل انضمامها
+        self.notify(3, users=[self.bob])
+        self.notify(4, users=[self.alice], is_hidden=True)
+        self.notify(60 * 48, is_global=True)
+
+        expected = [n.id for n in sorted(newer + tied + older, key=lambda n: (n.created_at, n.id), reverse=True)]
+        legacy = list(Notification.inbox_for(self.alice).order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(expected, legacy)
+        for page_size in (1, 2, 3, 4, 100):
+            self.assertEqual(self.walk(page_size), expected, page_size)
+
+    def test_global_items_and_read_state(self):
+        targeted = self.notify(3, users=[self.alice])
+        broadcast = self.notify(2, is_global=True)
+        read_broadcast = self.notify(1, is_global=True)
+        self.client.post(f'/api/user-notifications/global/{read_broadcast.id}/mark_as_read/')
+
+        response = self.client.get('/api/user-notifications/')
+        items = {item['notification']['id']: item for item in response.data['results']}
+        self.assertEqual(response.data['count'], 3)
+        self.assertIsNone(items[broadcast.id]['id'])
+        self.assertFalse(items[broadcast.id]['is_read'])
+        self.assertTrue(items[read_broadcast.id]['is_read'])
+        self.assertEqual(items[targeted.id]['id'], self.row_id(targeted))
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/api/user-notifications/?cursor=not-a-cursor').status_code, 404)
+
+
+class NotificationBulkActionTests(InboxTestCase):
+    def setUp(self):
+        super().setUp()
+        self.bob_client = APIClient()
+        self.bob_client.force_authenticate(self.bob)
+        self.shared = [self.notify(minutes, users=[self.alice, self.bob]) for minutes in (30, 20, 10)]
+        self.broadcasts = [self.notify(minutes, is_global=True) for minutes in (25, 15, 5)]
+
+    def bulk(self, action, **data):
+        response = self.client.post(f'/api/user-notifications/{action}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ids_only_touch_the_callers_rows(self):
+        bob_rows = [self.row_id(n, self.bob) for n in self.shared]
+        ids = [self.row_id(self.shared[0])] + bob_rows
+        self.assertEqual(self.bulk('bulk_mark_as_read', ids=ids)['updated'], 1)
+        self.assertEqual(self.bulk('bulk_delete', ids=ids)['deleted'], 1)
+
+        self.assertNotIn(self.shared[0].id, self.feed())
+        self.assertEqual(len(self.feed()), 5)
+        self.assertFalse(any(self.feed(self.bob_client).values()))
+        self.assertEqual(len(self.feed(self.bob_client)), 6)
+        # ids لا تمس الإشعارات العامة ولا watermark
+        self.assertFalse(NotificationReadWatermark.objects.exists())
+
+    def test_before_marks_older_rows_and_globals_read(self):
+        before = (self.now - timedelta(minutes=15)).isoformat()
+        self.assertEqual(self.bulk('bulk_mark_as_read', before=before)['updated'], 4)
+
+        read = {n.id for n in self.shared[:2] + self.broadcasts[:2]}
+        self.assertEqual(self.feed(), {n.id: n.id in read for n in self.shared + self.broadcasts})
+        watermark = NotificationReadWatermark.objects.get(user=self.alice)
+        self.assertEqual(watermark.global_read_until, self.now - timedelta(minutes=15))
+        self.assertIsNone(watermark.global_hidden_until)
+        self.assertFalse(any(self.feed(self.bob_client).values()))
+
+    def test_cursor_deletes_from_that_position_down(self):
+        page = self.client.get('/api/user-notifications/?page_size=2')
+        self.assertEqual(page.data['results'][-1]['notification']['id'], self.shared[2].id)
+        cursor = parse_qs(urlparse(page.data['next']).query)['cursor'][0]
+
+        # مؤشر الصفحة = آخر عنصر فيها: هو وكل ما أقدم منه يُحذف، عامة وموجّهة
+        self.assertEqual(self.bulk('bulk_delete', cursor=cursor)['deleted'], 5)
+        self.assertEqual(self.feed(), {self.broadcasts[2].id: False})
+        self.assertFalse(UserNotification.objects.filter(user=self.alice, notification__in=self.shared).exists())
+        self.assertEqual(len(self.feed(self.bob_client)), 6)
+
+    def test_all_covers_globals_with_watermarks(self):
+        self.bulk('bulk_delete', all=True)
+        self.assertEqual(self.feed(), {})
+        watermark = NotificationReadWatermark.objects.get(user=self.alice)
+        self.assertIsNotNone(watermark.global_read_until)
+        self.assertIsNotNone(watermark.global_hidden_until)
+        self.assertEqual(len(self.feed(self.bob_client)), 6)
+
+        later = self.notify(-1, is_global=True)
+        self.assertEqual(self.feed(), {later.id: False})
+
+    def test_scope_is_required(self):
+        response = self.client.post('/api/user-notifications/bulk_delete/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+class UnreadCounterTests(TestCase):
+    """كل مسار يعدّل الإشعارات يجب أن يترك unread_for() مساويًا لإعادة العد من الجداول."""
+
+    def setUp(self):
+        self.alice = CustomUser.objects.create_user(username='alice', password='x', role='employee')
+        self.bob = CustomUser.objects.create_user(username='bob', password='x', role='employee')
+        self.clients = {}
+        for user in (self.alice, self.bob):
+            self.clients[user] = APIClient()
+            self.clients[user].force_authenticate(user)
+        self.assertCountersFresh()
+
+    def recount(self, user):
+        global_total = Notification.objects.filter(is_global=True).count()
+        counts = UnreadCounter.compute_user(user, global_total)
+        return counts['notifications'] + global_total - counts['global_seen']
+
+    def assertCountersFresh(self, *users):
+        for user in users or (self.alice, self.bob):
+            self.assertEqual(UnreadCounter.unread_for(user)['notifications'], self.recount(user), user.username)
+
+    def send(self, **data):
+        response = self.clients[self.alice].post(
+            '/api/notifications/send_notification/', {'title': 't', 'message': 'm', 'importance': 'normal', **data}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return Notification.objects.latest('id')
+
+    def row(self, user, notification):
+        return UserNotification.objects.get(user=user, notification=notification).id
+
+    def test_send_and_read(self):
+        targeted = self.send(usernames=['alice', 'bob'])
+        broadcast = self.send()
+        self.assertCountersFresh()
+        self.assertEqual(UnreadCounter.unread_for(self.alice)['notifications'], 2)
+
+        self.clients[self.alice].post(f'/api/user-notifications/{self.row(self.alice, targeted)}/mark_as_read/')
+        self.clients[self.alice].post(f'/api/user-notifications/global/{broadcast.id}/mark_as_read/')
+        self.assertCountersFresh()
+        self.assertEqual(UnreadCounter.unread_for(self.alice)['notifications'], 0)
+
+        self.clients[self.bob].post('/api/user-notifications/bulk_mark_as_read/', {'all': True}, format='json')
+        self.assertCountersFresh()
+        self.assertEqual(UnreadCounter.unread_for(self.bob)['notifications'], 0)
+
+    def test_bulk_read_delete_and_hide(self):
+        first, second = self.send(usernames=['alice']), self.send(usernames=['alice', 'bob'])
+        broadcasts = [self.send(), self.send()]
+
+        self.clients[self.alice].post(
+            '/api/user-notifications/bulk_mark_as_read/', {'ids': [self.row(self.alice, first)]}, format='json'
+        )
+        self.assertCountersFresh()
+        self.clients[self.alice].post(f'/api/user-notifications/global/{broadcasts[0].id}/delete/')
+        self.assertCountersFresh()
+        self.clients[self.alice].post(
+            '/api/user-notifications/bulk_delete/', {'ids': [self.row(self.alice, second)]}, format='json'
+        )
+        self.assertCountersFresh()
+        self.clients[self.bob].post('/api/user-notifications/bulk_delete/', {'all': True}, format='json')
+        self.assertCountersFresh()
+        self.assertEqual(UnreadCounter.unread_for(self.alice)['notifications'], 1)
+        self.assertEqual(UnreadCounter.unread_for(self.bob)['notifications'], 0)
+
+    def test_crud_create_and_destroy(self):
+        targeted = self.send(usernames=['alice', 'bob'])
+        read_broadcast, unread_broadcast = self.send(), self.send()
+        self.clients[self.bob].post(f'/api/user-notifications/{self.row(self.bob, targeted)}/mark_as_read/')
+        self.clients[self.alice].post(f'/api/user-notifications/global/{read_broadcast.id}/mark_as_read/')
+        self.clients[self.bob].post('/api/user-notifications/bulk_mark_as_read/', {'all': True}, format='json')
+        # انضم بعد الإشعارات العامة: محتسبة له مقروءة
+        carol = CustomUser.objects.create_user(username='carol', password='x', role='employee')
+        self.assertCountersFresh(self.alice, self.bob, carol)
+
+        self.clients[self.alice].post('/api/notifications/', {'title': 't', 'message': 'm'}, format='json')
+        for notification in (targeted, read_broadcast, unread_broadcast):
+            response = self.clients[self.alice].delete(f'/api/notifications/{notification.id}/')
+            self.assertEqual(response.status_code, 204)
+            self.assertCountersFresh(self.alice, self.bob, carol)
+        self.assertEqual(UnreadCounter.unread_for(self.alice)['notifications'], 0)
+
+
+def _pdf_bytes(pages=1):
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    for number in range(pages):
+        pdf.drawString(100, 700, f'page {number + 1}')
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+class FormFileTestCase(TestCase):
+    """نماذج بملفات حقيقية في MEDIA_ROOT مؤقت."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_override = override_settings(MEDIA_ROOT=media.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.section = Section.objects.create(name_ar='قسم', name_en='Section')
+        self.user = CustomUser.objects.create_user(username='employee', password='x', role='employee')
+        UserSectionPermission.objects.create(user=self.user, section=self.section)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_form(self, serial, content=None):
+        form = FormModel(section=self.section, serial_number=serial, name_ar=serial, name_en=serial, category='c')
+        if content is None:
+            form.file.name = f'forms/{serial}.pdf'  # الملف غير موجود في التخزين
+            form.save()
+        else:
+            form.file.save(f'{serial}.pdf', ContentFile(content))
+        return form
+
+
+class FormPdfMetaTests(FormFileTestCase):
+    def test_save_with_missing_file_keeps_meta_stale(self):
+        form = self.create_form('missing')
+        form.name_en = 'renamed'
+        form.save()
+        form.refresh_from_db()
+        self.assertIsNone(form.pdf_meta)
+        self.assertEqual(self.client.get(f'/api/public-form/{form.pk}/').status_code, 404)
+
+    def test_meta_is_computed_on_upload(self):
+        form = self.create_form('two-pages', _pdf_bytes(pages=2))
+        form.refresh_from_db()
+        self.assertEqual(form.page_count, 2)
+        self.assertTrue(form.pdf_meta['incremental'])
+
+    def test_form_list_does_not_load_pdf_meta(self):
+        self.create_form('listed', _pdf_bytes())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/forms/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q['sql'] for q in queries if 'pdf_meta' in q['sql']])
+
+
+@override_settings(FILE_DELIVERY_BACKEND='python')
+class PublicFormPreviewTests(FormFileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.content = _pdf_bytes(pages=2)
+        self.form = self.create_form('public', self.content)
+        self.url = f'/api/public-form/{self.form.pk}/'
+
+    def get(self, **headers):
+        response = APIClient().get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_response_and_matching_etag(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        etag = response['ETag']
+        self.assertEqual(etag, f'"{self.form.file_sha256}"')
+
+        response, body = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_byte_range(self):
+        size = len(self.content)
+        response, body = self.get(range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{size}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(body, self.content[10:20])
+
+        response, body = self.get(range='bytes=-5')
+        self.assertEqual(response['Content-Range'], f'bytes {size - 5}-{size - 1}/{size}')
+        self.assertEqual(body, self.content[-5:])
+
+    def test_unsatisfiable_range(self):
+        size = len(self.content)
+        response, _ = self.get(range=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+
+    def test_stale_if_range_returns_whole_file(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(range='bytes=0-9', if_range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+        response, body = self.get(range='bytes=0-9', if_range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[:10])
+
+
+class StampedZipTests(FormFileTestCase):
+    def setUp(self):
+        super().setUp()
+        self.originals = {serial: _pdf_bytes(pages=2) for serial in ('first', 'second')}
+        for serial, content in self.originals.items():
+            self.create_form(serial, content)
+
+    def download(self):
+        ids = ','.join(str(pk) for pk in FormModel.objects.values_list('pk', flat=True))
+        response = self.client.get('/api/forms/stamped-zip/', {'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(sorted(archive.namelist()), ['first.pdf', 'second.pdf'])
+        entries = {name[:-4]: archive.read(name) for name in archive.namelist()}
+        serials = set()
+        for content in entries.values():
+            reader = PdfReader(io.BytesIO(content), strict=True)
+            texts = [page.extract_text() for page in reader.pages]
+            self.assertEqual(len(texts), 2)
+            stamps = {text[text.index('Serial Number:'):] for text in texts}
+            self.assertEqual(len(stamps), 1)
+            serials |= stamps
+        self.assertEqual(len(serials), 2)
+        return entries
+
+    @override_settings(FORM_STAMP_ENGINE='incremental', FORM_STAMP_POOL_SIZE=0)
+    def test_incremental_entries_append_to_original(self):
+        for serial, content in self.download().items():
+            self.assertTrue(content.startswith(self.originals[serial]))
+
+    @override_settings(FORM_STAMP_ENGINE='rewrite', FORM_STAMP_POOL_SIZE=0)
+    def test_rewrite_engine_is_honoured(self):
+        for serial, content in self.download().items():
+            self.assertFalse(content.startswith(self.originals[serial]))
+
+    @override_settings(FORM_STAMP_ENGINE='rewrite', FORM_STAMP_POOL_SIZE=1, FORM_STAMP_QUEUE_DEPTH=0)
+    def test_rewrite_entries_go_through_the_pool(self):
+        from core import stamping
+        pool = stamping.get_stamp_pool(1, 0)
+        with mock.patch.object(pool, '_submit', wraps=pool._submit) as submit:
+            entries = self.download()
+        self.assertEqual(submit.call_count, 2)
+        for serial, content in entries.items():
+            self.assertFalse(content.startswith(self.originals[serial]))
+
+
+@skipUnless(hasattr(os, 'mkfifo'), 'needs named pipes')
+class StampPoolTimeoutTests(SimpleTestCase):
+    def test_hung_job_gives_back_its_worker_and_slot(self):
+        from core.stamping import StampPool
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # قراءة FIFO بلا كاتب تعلق إلى الأبد، مثل تحليل PDF لا ينتهي
+        hung = os.path.join(directory.name, 'hung.pdf')
+        os.mkfifo(hung)
+        valid = os.path.join(directory.name, 'valid.pdf')
+        with open(valid, 'wb') as f:
+            f.write(_pdf_bytes())
+
+        pool = StampPool(workers=1, queue_depth=0)
+        self.addCleanup(lambda: pool._terminate(pool._executor))
+        with self.assertRaises(TimeoutError):
+            pool.stamp(hung, 'Serial Number: 1', timeout=2)
+
+        out_path = pool.stamp(valid, 'Serial Number: 2', timeout=30, wait=10)
+        self.addCleanup(os.unlink, out_path)
+        self.assertIn('Serial Number: 2', PdfReader(out_path).pages[0].extract_text())
+
+
+class IncrementalUpdateTests(SimpleTestCase):
+    def test_appended_xref_is_zero_indexed(self):
+        buffer = io.BytesIO()
+        pdf = canvas.Canvas(buffer)
+        pdf.drawString(100, 700, 'page')
+        pdf.showPage()
+        pdf.save()
+        original = buffer.getvalue()
+
+        tail = incremental_update(describe_pdf(io.BytesIO(original)), 'Serial Number: 1')
+        self.assertTrue(tail[tail.index(b'\nxref\n'):].startswith(b'\nxref\n0 1\n0000000000 65535 f\r\n'))
+        reader = PdfReader(io.BytesIO(original + tail), strict=True)
+        self.assertIn('Serial Number: 1', reader.pages[0].extract_text())
+
+
+class DashboardSummaryTests(TestCase):
+    def test_pending_surveys_follow_survey_visibility(self):
+        manager = CustomUser.objects.create_user(username='manager', password='x', role='manager')
+        employee = CustomUser.objects.create_user(username='employee', password='x', role='employee')
+        for creator_role in ('manager', 'hr'):
+            Survey.objects.create(title=creator_role, creator_role=creator_role, status='published')
+        Survey.objects.create(title='draft', creator_role='manager')
+
+        client = APIClient()
+        for user, expected in ((manager, 1), (employee, 2)):
+            client.force_authenticate(user)
+            self.assertEqual(client.get('/api/summary/').data['pending_surveys'], expected)
+
+
+class EventStreamTicketTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='employee', password='x', role='employee')
+
+    def stream_user(self, **params):
+        from core import views
+        return views._event_stream_user(RequestFactory().get('/api/events/', params))
+
+    def test_ticket_identifies_user(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        ticket = client.post('/api/events/ticket/').data['ticket']
+        self.assertEqual(self.stream_user(ticket=ticket), self.user)
+        self.assertIsNone(self.stream_user(ticket=ticket + 'x'))
+
+    @override_settings(EVENT_STREAM_TICKET_MAX_AGE=0)
+    def test_expired_ticket_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        ticket = client.post('/api/events/ticket/').data['ticket']
+        time.sleep(1)
+        self.assertIsNone(self.stream_user(ticket=ticket))
+
+    def test_jwt_in_query_string_is_not_accepted(self):
+        self.assertIsNone(self.stream_user(token=str(AccessToken.for_user(self.user))))
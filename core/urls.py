@@ -24,12 +24,16 @@ from .views import (
     mark_complaint_as_seen,
     has_unread_complaints,
     mark_all_complaints_seen,
+    unread_counts,
+    event_stream,
+    event_stream_ticket,
     EmployeeSearchView,
     AdjustPointsView,
     HonorBoardView,
     HonorBoardToggleView,
     AvatarUploadView,
     MeView,
+    DashboardSummaryView,
 )
 
 router = DefaultRouter()
@@ -65,6 +69,10 @@ urlpatterns = [
     path("complaints/<int:pk>/mark_seen/", mark_complaint_as_seen),
     path("complaints/has_unread/", has_unread_complaints, name="has-unread-complaints"),
     path("mark-all-complaints-seen/", mark_all_complaints_seen, name="mark_all_complaints_seen"),
+    path("unread-counts/", unread_counts, name="unread-counts"),
+    path("summary/", DashboardSummaryView.as_view(), name="dashboard-summary"),
+    path("events/", event_stream, name="event-stream"),
+    path("events/ticket/", event_stream_ticket, name="event-stream-ticket"),
 
     # Honor board & points (تستخدم في PointsManager و HonorBoard)
     path("users/search/", EmployeeSearchView.as_view(), name="user-search"),
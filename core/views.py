@@ -7,14 +7,16 @@ from django.shortcuts import get_object_or_404
 from django.http import FileResponse, Http404
 from django.utils import timezone
 from rest_framework import status
-from .pagination import StandardResultsSetPagination
+from .pagination import StandardResultsSetPagination, KeysetPagination
 from django.db import transaction
 from django.db import models as dj_models
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.exceptions import NotFound, ValidationError
 from .models import CustomUser, EmployeePointLog, HonorBoardSetting
 from .serializers import (
     SimpleUserSerializer,
@@ -23,17 +25,29 @@ from .serializers import (
     HonorBoardEntrySerializer,
 )
 
-from .models import Notification, UserNotification, Section, FormModel, Complaint
+from .models import Notification, UserNotification, NotificationReadWatermark, Section, FormModel, Complaint
+from .models import UnreadCounter
 from .serializers import (
     SectionSerializer,
     FormModelSerializer,
     NotificationSerializer,
-    UserNotificationSerializer,
+    InboxNotificationSerializer,
     ComplaintSerializer,
     MyTokenObtainPairSerializer
 )
 
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework.exceptions import AuthenticationFailed
+from asgiref.sync import sync_to_async
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+import asyncio
+import hashlib
+import json
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
@@ -75,99 +89,289 @@ class UserListAPIView(APIView):
 
 
 # 🌐 عرض النموذج للعامة بدون حماية
-@api_view(['GET'])
+@api_view(['GET', 'HEAD'])
 def public_form_preview(request, pk):
     try:
         form = FormModel.objects.get(pk=pk)
-        return FileResponse(form.file.open(), content_type='application/pdf')
     except FormModel.DoesNotExist:
         raise Http404("Form not found")
-from django.http import HttpResponse, FileResponse
+    # ETag قوي من hash الملف المخزن + 304 / Range (206) + Cache-Control طويل
+    if not form.has_fresh_pdf_meta(check_size=True) and not form.refresh_pdf_meta():
+        raise Http404("Form file not found")
+    return serve_file(
+        request, form.file, 'application/pdf',
+        etag=form.file_sha256 or None,
+        max_age=getattr(settings, 'FORM_PREVIEW_MAX_AGE', 86400),
+    )
+from django.http import FileResponse
 from django.shortcuts import get_object_or_404
-from datetime import datetime
-from io import BytesIO
-
-from PyPDF2 import PdfReader, PdfWriter
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
+from datetime import datetime, timedelta
+import re
+import tempfile
+import zipfile
 
 from .models import FormModel
-from django.http import HttpResponse, FileResponse
-import time
+from .stamping import stamp_pdf, incremental_update, get_stamp_pool, StampQueueFull
+from django.conf import settings
+from django.http import StreamingHttpResponse, JsonResponse
+from .serials import SerialAllocator, serial_datetime
+from .models import StampWorker
+from .file_serving import serve_file, offload_response
+from .events import hub, publish_on_commit, user_channel, role_channel, BROADCAST
+from .search import search_complaints
+from .analytics import complaint_stats, invalidate_complaint_stats
+import os
 import threading
 
-_LAST_NS = 0
-_LAST_NS_LOCK = threading.Lock()
+_SERIALS = None
+# صف StampWorker المحجوز لهذه العملية (None مع STAMP_WORKER_ID صريح)
+_SERIAL_WORKER = None
+# مولّدان في نفس العملية بنفس رقم العامل قد يصدران نفس الرقم: الإنشاء الأول تحت قفل
+_SERIALS_LOCK = threading.Lock()
+
+
+def _reset_serials_after_fork():
+    global _SERIALS, _SERIAL_WORKER, _SERIALS_LOCK
+    _SERIALS, _SERIAL_WORKER, _SERIALS_LOCK = None, None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_serials_after_fork)
+
+
+def _claim_is_fresh() -> bool:
+    # الحجز يُجدَّد كل ثلث STAMP_WORKER_TTL فلا ينتهي ما دامت العملية تختم
+    worker = _SERIAL_WORKER
+    return worker is None or timezone.now() - worker.heartbeat_at < StampWorker.ttl() / 3
+
+
+def _serial_allocator() -> SerialAllocator:
+    """مولّد الأرقام التسلسلية لهذه العملية (واحد فقط، ويُعاد إنشاؤه بعد fork)."""
+    global _SERIALS, _SERIAL_WORKER
+    allocator = _SERIALS
+    if allocator is not None and allocator.pid == os.getpid() and _claim_is_fresh():
+        return allocator
+    with _SERIALS_LOCK:
+        if _SERIALS is not None and _SERIALS.pid == os.getpid():
+            if _claim_is_fresh() or _SERIAL_WORKER.beat():
+                return _SERIALS
+            # انتهى الحجز (عملية خاملة طويلًا) وقد يكون رقمها لعملية أخرى الآن: نحجز رقمًا جديدًا
+        worker_id = getattr(settings, 'STAMP_WORKER_ID', None)
+        if worker_id not in (None, ''):
+            _SERIALS, _SERIAL_WORKER = SerialAllocator(int(worker_id)), None
+        else:
+            # بدون رقم صريح: أصغر رقم غير مستخدم من جدول StampWorker
+            _SERIAL_WORKER = StampWorker.claim()
+            _SERIALS = SerialAllocator(_SERIAL_WORKER.worker_id)
+        return _SERIALS
+
 
 def _unique_time_ns() -> int:
-    global _LAST_NS
-    ns = time.time_ns()
-    with _LAST_NS_LOCK:
-        if ns <= _LAST_NS:
-            ns = _LAST_NS + 1   # نضمن التزايد وعدم التكرار
-        _LAST_NS = ns
-    return ns
+    # 19 خانة: وقت بالمللي ثانية + رقم العامل + تسلسل؛ فريد عبر العمليات والخوادم دون قفل مشترك
+    return _serial_allocator().next()
 
 
-def preview_form(request, form_id):
+def _stamp_text() -> str:
+    serial = _unique_time_ns()
+    human = serial_datetime(serial).strftime("%Y-%m-%d %H:%M:%S.%f")
+    return f"Serial Number: {serial} | Date: {human}"
+
+
+def _incremental_tail(form, stamp_text):
     """
-    يعرض ملف PDF مع ختم سفلي ثابت:
-      Serial Number: <19-digit ns> | Date: <YYYY-mm-dd HH:MM:SS.%f>
-    الرقم مبني على time.time_ns() مع ضمان تفرد داخل العملية.
+    يبني قسم incremental update الذي يُلحق بنهاية الملف الأصلي.
+    يرجع (tail, original_size) أو None إذا كان الملف لا يدعم هذه الطريقة (مشفّر، xref stream، ...).
     """
-    form = get_object_or_404(FormModel, id=form_id)
+    try:
+        # البنية محسوبة مسبقًا عند حفظ النموذج؛ نعيد حسابها فقط إن تغيّر الملف
+        if not form.has_fresh_pdf_meta(check_size=True) and not form.refresh_pdf_meta():
+            return None
+        layout = form.pdf_meta
+        if not layout.get('incremental'):
+            return None
+        return incremental_update(layout, stamp_text), layout['size']
+    except Exception:
+        return None
+
 
-    # 1) قراءة PDF كـ bytes
+def _rewrite_stamped_file(form, stamp_text):
+    """
+    مسار إعادة الكتابة الكاملة: الناتج في ملف مؤقت (ذاكرة للصغير، قرص للكبير).
+    يرجع None عند الفشل.
+    """
+    out = tempfile.SpooledTemporaryFile(
+        max_size=getattr(settings, 'FORM_STAMP_SPOOL_MAX_BYTES', 4 * 1024 * 1024)
+    )
     try:
         with form.file.open('rb') as f:
-            original_pdf_bytes = f.read()
+            stamp_pdf(f, out, stamp_text)
     except Exception:
-        return FileResponse(form.file.open('rb'), content_type='application/pdf')
-
-    # 2) توليد رقم نانوي فريد + التاريخ المكافئ بدقة ميكروثانية للعرض
-    ns = _unique_time_ns()  # 19 خانة
-    human = datetime.fromtimestamp(ns / 1_000_000_000).strftime("%Y-%m-%d %H:%M:%S.%f")
-    stamp_text = f"Serial Number: {ns} | Date: {human}"
-
-    # 3) طبقة الختم
-    def _make_stamp_layer(page_width, page_height, text, font_size=9):
-        buf = BytesIO()
-        c = canvas.Canvas(buf, pagesize=(page_width, page_height))
-        c.setFont("Helvetica", font_size)
-        c.setFillGray(0.35)
-        margin_x = 12 * mm
-        margin_y = 4 * mm   # أقرب للحافة السفلية
-        c.drawRightString(page_width - margin_x, margin_y, text)
-        c.save()
-        buf.seek(0)
-        return PdfReader(buf).pages[0]
-
-    # 4) دمج الختم داخل كل صفحات PDF
+        out.close()
+        return None
+    out.seek(0)
+    return out
+
+
+def _pooled_stamped_file(form, stamp_text, wait=0):
+    """
+    ينفّذ مسار إعادة الكتابة داخل مجمّع العمليات (FORM_STAMP_POOL_SIZE > 0).
+    wait: ثواني انتظار مكان في الطابور قبل اعتباره ممتلئًا (0 = الرفض فورًا).
+    يرجع None إذا كان التخزين لا يوفر مسارًا محليًا للملف (ننفّذ داخل العملية حينها).
+    """
     try:
-        reader = PdfReader(BytesIO(original_pdf_bytes))
-        writer = PdfWriter()
-
-        for page in reader.pages:
-            w = float(page.mediabox.width)
-            h = float(page.mediabox.height)
-            layer = _make_stamp_layer(w, h, stamp_text)
-            page.merge_page(layer)
-            writer.add_page(page)
-
-        out = BytesIO()
-        writer.write(out)
-        out.seek(0)
-        stamped_bytes = out.read()
-
-        resp = HttpResponse(stamped_bytes, content_type="application/pdf")
-        resp['Content-Disposition'] = f'inline; filename="form-{form_id}.pdf"'
-        return resp
+        src_path = form.file.path
+    except NotImplementedError:
+        return None
 
+    timeout = getattr(settings, 'FORM_STAMP_TIMEOUT', 10)
+    pool = get_stamp_pool(settings.FORM_STAMP_POOL_SIZE, getattr(settings, 'FORM_STAMP_QUEUE_DEPTH', 8))
+    try:
+        out_path = pool.stamp(src_path, stamp_text, timeout, wait=wait)
+    except StampQueueFull:
+        return 'busy', None
     except Exception:
-        # Fallback آمن: رجّع الملف الأصلي كما هو
-        response = FileResponse(form.file.open('rb'), content_type='application/pdf')
-        response['Content-Disposition'] = 'inline; filename="form.pdf"'
+        # تجاوز المهلة أو تعطل العامل: الملف الأصلي بدون ختم
+        return 'original', None
+
+    out = open(out_path, 'rb')
+    os.unlink(out_path)  # يبقى مقروءًا ما دام مفتوحًا ويُحذف فعليًا عند الإغلاق
+    return 'file', out
+
+
+def _stamped_source(form, stamp_text, wait=0):
+    """
+    يختار محرك الختم لنموذج واحد (نفس الترتيب لـ preview_form و ZIP):
+      1) FORM_STAMP_ENGINE="incremental": ("tail", (tail, original_size)) يُلحق بالأصل
+      2) إعادة الكتابة داخل المجمّع إن FORM_STAMP_POOL_SIZE > 0، وإلا داخل العملية:
+         ("file", ملف مفتوح يغلقه المستدعي)
+      ("busy", None) طابور المجمّع ممتلئ، ("original", None) تعذّر الختم
+    """
+    if getattr(settings, 'FORM_STAMP_ENGINE', 'incremental') == 'incremental':
+        incremental = _incremental_tail(form, stamp_text)
+        if incremental is not None:
+            return 'tail', incremental
+
+    # دمج الختم داخل كل صفحات PDF (طبقة واحدة لكل مقاس صفحة)
+    if getattr(settings, 'FORM_STAMP_POOL_SIZE', 0) > 0:
+        source = _pooled_stamped_file(form, stamp_text, wait)
+        if source is not None:
+            return source
+
+    out = _rewrite_stamped_file(form, stamp_text)
+    return ('file', out) if out is not None else ('original', None)
+
+
+def _stamped_chunks(form, stamp_text, chunk_size=64 * 1024):
+    """
+    يبثّ الملف مختومًا على دفعات بنفس اختيار المحرك في preview_form.
+    لا يمكن إرجاع 503 وسط البث: ينتظر مكانًا في المجمّع حتى FORM_STAMP_TIMEOUT ثم يرسل الأصل بدون ختم.
+    """
+    kind, value = _stamped_source(form, stamp_text, wait=getattr(settings, 'FORM_STAMP_TIMEOUT', 10))
+    if kind == 'tail':
+        with form.file.open('rb') as f:
+            yield from f.chunks(chunk_size)
+        yield value[0]
+        return
+    if kind == 'file':
+        with value:
+            yield from iter(lambda: value.read(chunk_size), b'')
+        return
+    with form.file.open('rb') as f:
+        yield from f.chunks(chunk_size)
+
+
+def _original_file_response(form):
+    """الملف الأصلي بدون ختم: عبر الخادم الأمامي إن أمكن (FILE_DELIVERY_BACKEND) وإلا من Python."""
+    response = offload_response(form.file, 'application/pdf', filename='form.pdf')
+    if response is not None:
         return response
+    response = FileResponse(form.file.open('rb'), content_type='application/pdf')
+    response['Content-Disposition'] = 'inline; filename="form.pdf"'
+    return response
+
+
+def preview_form(request, form_id):
+    """
+    يعرض ملف PDF مع ختم سفلي ثابت:
+      Serial Number: <19-digit serial> | Date: <YYYY-mm-dd HH:MM:SS.%f>
+    الرقم من core.serials: فريد عبر العمليات والخوادم (STAMP_WORKER_ID لكل عامل).
+    المحرك الافتراضي (FORM_STAMP_ENGINE="incremental") لا يعيد كتابة الملف،
+    ويرجع لمسار إعادة الكتابة الكاملة للملفات التي لا يدعمها (انظر _stamped_source).
+    """
+    form = get_object_or_404(FormModel, id=form_id)
+
+    kind, value = _stamped_source(form, _stamp_text())
+
+    if kind == 'tail':
+        # الملف الأصلي كما هو ثم الملحق
+        tail, size = value
+
+        def stream():
+            with form.file.open('rb') as f:
+                yield from f.chunks()
+            yield tail
+
+        resp = StreamingHttpResponse(stream(), content_type="application/pdf")
+        resp['Content-Length'] = str(size + len(tail))
+        resp['Content-Disposition'] = f'inline; filename="form-{form_id}.pdf"'
+        return resp
+
+    if kind == 'file':
+        # الناتج يُبثّ من الملف المؤقت عبر FileResponse (مع Content-Length) بدل نسخه إلى HttpResponse
+        return FileResponse(value, content_type="application/pdf", filename=f"form-{form_id}.pdf")
+
+    if kind == 'busy':
+        resp = JsonResponse({'detail': 'Stamping queue is full, retry later.'}, status=503)
+        resp['Retry-After'] = str(getattr(settings, 'FORM_STAMP_RETRY_AFTER', 5))
+        return resp
+
+    # Fallback آمن: رجّع الملف الأصلي كما هو
+    return _original_file_response(form)
+
+
+class _ZipStream:
+    """
+    وجهة كتابة غير قابلة للـ seek لـ zipfile: نجمع ما يُكتب ونفرّغه للعميل بعد كل دفعة،
+    فتبقى الذاكرة ثابتة مهما كان عدد الملفات أو حجمها.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def _stamped_zip_stream(forms):
+    sink = _ZipStream()
+    used_names = set()
+    # PDF لا يستفيد من الضغط تقريبًا؛ ZIP_STORED يوفّر CPU
+    with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_STORED) as archive:
+        for form in forms:
+            base = re.sub(r'[^\w.-]+', '_', form.serial_number) or f"form-{form.id}"
+            name = f"{base}.pdf"
+            if name in used_names:
+                name = f"{base}-{form.id}.pdf"
+            used_names.add(name)
+
+            with archive.open(name, mode='w', force_zip64=True) as entry:
+                for chunk in _stamped_chunks(form, _stamp_text()):
+                    entry.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
 
 
 # 🔔 إرسال إشعار لمستخدمين أو للجميع
@@ -177,6 +381,13 @@ class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
 
+    # الإنشاء عبر هذا المسار لا يضيف مستلمين ولا إشعارًا عامًا (is_global للقراءة فقط) فلا يغيّر العدادات؛
+    # أما الحذف فيطرح أثر الإشعار منها قبل أن تُحذف صفوف المستخدمين معه
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            UnreadCounter.discount(instance)
+            instance.delete()
+
     @action(detail=False, methods=['post'])
     def send_notification(self, request):
         print(request.data)
@@ -184,23 +395,37 @@ class NotificationViewSet(viewsets.ModelViewSet):
         message = request.data.get('message')
         importance = request.data.get('importance')
         usernames = request.data.get('usernames')  # قائمة الأسماء
-
-        notification = Notification.objects.create(
-            title=title,
-            message=message,
-            importance=importance
-        )
+        # الإرسال للجميع يُخزن كإشعار عام واحد (is_global) بدل صف لكل مستخدم؛ is_global=false يفرض التوزيع الفردي
+        is_global = str(request.data.get('is_global', not usernames)).lower() in ('true', '1')
 
         if usernames:
             users = User.objects.filter(username__in=usernames)
         else:
             users = User.objects.all()
 
-        UserNotification.objects.bulk_create([
-            UserNotification(user=user, notification=notification) for user in users
-        ])
-
-        return Response({'status': 'Notification sent successfully'}, status=status.HTTP_201_CREATED)
+        with transaction.atomic():
+            notification = Notification.objects.create(
+                title=title,
+                message=message,
+                importance=importance,
+                is_global=is_global and not usernames,
+            )
+            if notification.is_global:
+                recipients = users.count()
+                UnreadCounter.add(role=UnreadCounter.GLOBAL, notifications=1)
+            else:
+                # دفعات من المعرفات فقط (ذاكرة ثابتة مهما كان عدد الموظفين)
+                recipients = notification.deliver_to(users)
+            if usernames:
+                channels = [user_channel(user_id) for user_id in users.values_list('id', flat=True)]
+            else:
+                channels = [BROADCAST]
+            publish_on_commit(channels, 'notification', notification_id=notification.id)
+
+        return Response(
+            {'status': 'Notification sent successfully', 'recipients': recipients},
+            status=status.HTTP_201_CREATED,
+        )
 
 
 # 📂 عرض الأقسام (Tabs)
@@ -218,11 +443,47 @@ class FormModelViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        # pdf_meta (مواقع xref لكل كائن) كبير ولا تحتاجه القائمة؛ الختم يقرؤه لكل نموذج عند الحاجة فقط
+        forms = FormModel.objects.defer('pdf_meta')
         # المدير والموارد البشرية يمكنهم الوصول لكل النماذج
         if hasattr(user, 'profile') and user.profile.role in ['manager', 'hr']:
-            return FormModel.objects.all()
+            return forms.all()
         allowed_sections = user.usersectionpermission_set.values_list('section_id', flat=True)
-        return FormModel.objects.filter(section__id__in=allowed_sections)
+        return forms.filter(section__id__in=allowed_sections)
+
+    @action(detail=False, methods=['get', 'post'], url_path='stamped-zip')
+    def stamped_zip(self, request):
+        """
+        تحميل عدة نماذج مختومة كملف ZIP واحد يُبثّ أثناء الختم:
+          ?section=<id>  أو  ?ids=1,2,3  (أو body: {"section": id} / {"ids": [..]})
+        كل ملف يحمل رقمه التسلسلي الخاص، والنتائج مقيدة بصلاحيات الأقسام (get_queryset).
+        """
+        params = request.data if request.method == 'POST' else request.query_params
+        section_id = params.get('section')
+        ids = params.get('ids')
+        if isinstance(ids, str):
+            ids = [i for i in ids.split(',') if i.strip()]
+
+        qs = self.get_queryset().exclude(file='').order_by('id')
+        try:
+            if section_id:
+                qs = qs.filter(section_id=int(section_id))
+                filename = f"section-{int(section_id)}-forms.zip"
+            elif ids:
+                qs = qs.filter(id__in=[int(i) for i in ids])
+                filename = "forms.zip"
+            else:
+                return Response({'detail': 'section or ids is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({'detail': 'Invalid section or ids.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        forms = list(qs)
+        if not forms:
+            return Response({'detail': 'No forms found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        resp = StreamingHttpResponse(_stamped_zip_stream(forms), content_type='application/zip')
+        resp['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return resp
 
 
 # 📩 إشعارات المستخدم الفردية
@@ -231,32 +492,299 @@ class UserNotificationViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def list(self, request):
-        user_notifications = UserNotification.objects.filter(
-            user=request.user
-        ).order_by('-notification__created_at')
+        # ?page= (الواجهة القديمة) يبقى بترقيم الصفحات؛ بدونها التقسيم بالمؤشر (انظر _feed)
+        if 'page' not in request.query_params:
+            return self._feed(request)
+
+        # الموجّهة للمستخدم + العامة في استعلام واحد (انظر Notification.inbox_for)
+        notifications = Notification.inbox_for(request.user).order_by('-created_at', '-id')
 
         paginator = self.pagination_class()
-        page = paginator.paginate_queryset(user_notifications, request, view=self)
-        serializer = UserNotificationSerializer(page, many=True)
+        page = paginator.paginate_queryset(notifications, request, view=self)
+        serializer = InboxNotificationSerializer(page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
+    def _feed(self, request):
+        """
+        صندوق الإشعارات مرتبًا (created_at, notification_id) تنازليًا بدون OFFSET:
+        فرع الصفوف الموجّهة (فهرس user, created_at) + فرع الإشعارات العامة بلا صف للمستخدم،
+        كل فرع يجلب page_size + 1 بعد المؤشر ثم يُدمجان هنا.
+        """
+        user = request.user
+        paginator = KeysetPagination()
+        size = paginator.get_page_size(request)
+        cursor = paginator.decode_cursor(request)
+        watermark = NotificationReadWatermark.objects.filter(user=user).first()
+
+        rows = UserNotification.objects.filter(user=user, is_hidden=False)
+        global_notifications = self._unmaterialized_globals(user, watermark)
+        count = rows.count() + global_notifications.count() if paginator.include_count(request) else None
+
+        if cursor is not None:
+            created_at, notification_id = self._cursor_key(cursor)
+            rows = rows.filter(
+                dj_models.Q(created_at__lt=created_at) |
+                dj_models.Q(created_at=created_at, notification_id__lt=notification_id)
+            )
+            global_notifications = global_notifications.filter(
+                dj_models.Q(created_at__lt=created_at) | dj_models.Q(created_at=created_at, id__lt=notification_id)
+            )
+
+        items = []
+        for row in rows.select_related('notification').order_by('-created_at', '-notification_id')[:size + 1]:
+            notification = row.notification
+            notification.user_row_id, notification.read_state = row.id, row.is_read
+            items.append(notification)
+        read_until = watermark.global_read_until if watermark else None
+        for notification in global_notifications.order_by('-created_at', '-id')[:size + 1]:
+            notification.user_row_id = None
+            notification.read_state = read_until is not None and notification.created_at <= read_until
+            items.append(notification)
+
+        items.sort(key=lambda n: (n.created_at, n.id), reverse=True)
+        page = items[:size]
+        next_key = (page[-1].created_at.isoformat(), page[-1].id) if len(items) > size else None
+        serializer = InboxNotificationSerializer(page, many=True)
+        return paginator.get_paginated_response(request, serializer.data, next_key, count=count)
+
+    @staticmethod
+    def _unmaterialized_globals(user, watermark):
+        """الإشعارات العامة الظاهرة للمستخدم وليس له صف فيها (لم يقرأها ولم يحذفها فرديًا)."""
+        qs = Notification.objects.filter(
+            is_global=True, created_at__gte=user.date_joined
+        ).exclude(
+            dj_models.Exists(UserNotification.objects.filter(user=user, notification=dj_models.OuterRef('pk')))
+        )
+        if watermark is not None and watermark.global_hidden_until is not None:
+            qs = qs.filter(created_at__gt=watermark.global_hidden_until)
+        return qs
+
+    @staticmethod
+    def _cursor_key(cursor):
+        """(created_at, notification_id) من مؤشر الصندوق."""
+        try:
+            created_at, notification_id = parse_datetime(cursor[0]), int(cursor[1])
+        except (IndexError, TypeError, ValueError):
+            created_at = None
+        if created_at is None:
+            raise NotFound('Invalid cursor')
+        return created_at, notification_id
+
+    def _bulk_scope(self, request):
+        """
+        نطاق العمليات الجماعية من body:
+          {"ids": [..]}       معرفات UserNotification
+          {"cursor": "..."}   كل ما في الصندوق عند هذا المؤشر وما قبله (الأقدم)
+          {"before": "<ISO>"} كل ما أُنشئ حتى هذا الوقت
+          {"all": true}
+        يرجع (rows, until): rows صفوف المستخدم ضمن النطاق، until حد الإشعارات العامة (None لـ ids).
+        """
+        data = request.data
+        rows = UserNotification.objects.filter(user=request.user)
+        if str(data.get('all', '')).lower() in ('true', '1'):
+            return rows, timezone.now()
+        ids = data.get('ids')
+        if ids:
+            if isinstance(ids, str):
+                ids = ids.split(',')
+            try:
+                return rows.filter(pk__in=[int(i) for i in ids]), None
+            except (TypeError, ValueError):
+                raise ValidationError({'ids': 'Invalid ids.'})
+        if data.get('cursor'):
+            created_at, notification_id = self._cursor_key(KeysetPagination().decode(data['cursor']))
+            return rows.filter(
+                dj_models.Q(created_at__lt=created_at) |
+                dj_models.Q(created_at=created_at, notification_id__lte=notification_id)
+            ), min(created_at, timezone.now())
+        if data.get('before'):
+            try:
+                before = parse_datetime(str(data['before']))
+            except ValueError:
+                before = None
+            if before is None:
+                raise ValidationError({'before': 'Invalid datetime.'})
+            if timezone.is_naive(before):
+                before = timezone.make_aware(before)
+            return rows.filter(created_at__lte=before), min(before, timezone.now())
+        raise ValidationError({'detail': 'ids, cursor, before or all is required.'})
+
+    def _cover_globals(self, user, field, until):
+        """يرفع watermark ويعيد عدد الإشعارات العامة (بلا صف) التي دخلت النطاق للتو."""
+        previous = NotificationReadWatermark.advance(user, field, until)
+        if previous is not None and until <= previous:
+            return 0
+        newly = Notification.objects.filter(
+            is_global=True, created_at__gte=user.date_joined, created_at__lte=until
+        ).exclude(
+            dj_models.Exists(UserNotification.objects.filter(user=user, notification=dj_models.OuterRef('pk')))
+        )
+        if previous is not None:
+            newly = newly.filter(created_at__gt=previous)
+        return newly.count()
+
+    @action(detail=False, methods=['post'])
+    def bulk_mark_as_read(self, request):
+        """تعليم عدة إشعارات كمقروءة بـ UPDATE واحد على صفوف المستخدم (+ watermark للإشعارات العامة)."""
+        user = request.user
+        rows, until = self._bulk_scope(request)
+        with transaction.atomic():
+            updated = rows.filter(is_read=False).update(is_read=True)
+            UnreadCounter.add(users=[user.id], notifications=-updated)
+            if until is not None:
+                # الإشعارات العامة بلا صف تُعلَّم برفع watermark بدل إنشاء صف لكل منها
+                newly = self._cover_globals(user, 'global_read_until', until)
+                UnreadCounter.add(users=[user.id], global_seen=newly)
+                updated += newly
+        return Response({'status': 'Marked as read', 'updated': updated})
+
+    @action(detail=False, methods=['post'])
+    def bulk_delete(self, request):
+        """
+        حذف عدة إشعارات من صندوق المستخدم: الموجّهة تُحذف فعليًا، والعامة تُخفى
+        (صف استثناء is_hidden أو global_hidden_until) لأنها مشتركة بين الجميع.
+        """
+        user = request.user
+        rows, until = self._bulk_scope(request)
+        targeted = rows.filter(notification__is_global=False)
+        with transaction.atomic():
+            unread = targeted.filter(is_read=False).count()
+            deleted = targeted.delete()[0]
+            deleted += rows.filter(is_hidden=False).update(is_hidden=True, is_read=True)
+            UnreadCounter.add(users=[user.id], notifications=-unread)
+            if until is not None:
+                # المحذوف من العامة يُحتسب مقروءًا أيضًا
+                read_globals = self._cover_globals(user, 'global_read_until', until)
+                UnreadCounter.add(users=[user.id], global_seen=read_globals)
+                deleted += self._cover_globals(user, 'global_hidden_until', until)
+        return Response({'status': 'Deleted', 'deleted': deleted})
+
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
-        try:
-            user_notification = UserNotification.objects.get(pk=pk, user=request.user)
-            user_notification.is_read = True
-            user_notification.save()
-            return Response({'status': 'Marked as read'})
-        except UserNotification.DoesNotExist:
+        rows = UserNotification.objects.filter(pk=pk, user=request.user)
+        with transaction.atomic():
+            # تحديث ضيق مشروط: ينقص العداد فقط إذا كان الإشعار غير مقروء فعلًا
+            if rows.filter(is_read=False).update(is_read=True):
+                UnreadCounter.add(users=[request.user.id], notifications=-1)
+            elif not rows.exists():
+                return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'Marked as read'})
+
+    # الإشعارات العامة ليس لها صف للمستخدم (id=null في الصندوق): تُعالَج فرديًا برقم الإشعار نفسه
+    # POST global/<notification_id>/mark_as_read  و  POST global/<notification_id>/delete
+    def _global_row(self, request, notification_id, **flags):
+        notification = Notification.objects.filter(
+            pk=notification_id, is_global=True, created_at__gte=request.user.date_joined
+        ).first()
+        if notification is None:
+            return None
+        read_until = NotificationReadWatermark.objects.filter(user=request.user).values_list(
+            'global_read_until', flat=True
+        ).first()
+        with transaction.atomic():
+            user_notification, created = UserNotification.objects.get_or_create(
+                user=request.user, notification=notification, defaults={'is_read': True, **flags}
+            )
+            was_unread = created or not user_notification.is_read
+            if not created:
+                UserNotification.objects.filter(pk=user_notification.pk).update(is_read=True, **flags)
+            if was_unread and (read_until is None or notification.created_at > read_until):
+                UnreadCounter.add(users=[request.user.id], global_seen=1)
+        return user_notification
+
+    @action(detail=False, methods=['post'], url_path=r'global/(?P<notification_id>\d+)/mark_as_read')
+    def mark_global_as_read(self, request, notification_id=None):
+        user_notification = self._global_row(request, notification_id)
+        if user_notification is None:
+            return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'Marked as read', 'id': user_notification.id})
+
+    # حذف إشعار عام واحد = إخفاؤه لهذا المستخدم فقط (صف استثناء is_hidden)
+    @action(detail=False, methods=['post'], url_path=r'global/(?P<notification_id>\d+)/delete')
+    def delete_global(self, request, notification_id=None):
+        if self._global_row(request, notification_id, is_hidden=True) is None:
             return Response({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'Deleted', 'deleted': 1})
 
 # 📝 API مخصصة للشكاوى
+def _save_complaint_reply(complaint, response_text, user):
+    """يحفظ الرد ويعدّل العدادات حسب الحالة السابقة (complaint مقفول بـ select_for_update)."""
+    recipient_delta = 0 if complaint.is_seen_by_recipient else -1
+    employee_delta = 0 if (complaint.is_responded and not complaint.is_seen_by_employee) else 1
+
+    complaint.response = response_text
+    complaint.is_responded = True
+    complaint.responded_by = user
+    complaint.responded_at = timezone.now()
+    complaint.is_seen_by_recipient = True     # الجهة المعالجة قرأتها
+    complaint.is_seen_by_employee = False     # الموظف لديه رد جديد غير مقروء
+    complaint.save(update_fields=[
+        'response','is_responded','responded_by','responded_at',
+        'is_seen_by_recipient','is_seen_by_employee'
+    ])
+    UnreadCounter.add(role=complaint.recipient_type, complaints=recipient_delta)
+    UnreadCounter.add(users=[complaint.sender_id], complaints=employee_delta)
+    invalidate_complaint_stats(complaint)
+    publish_on_commit([user_channel(complaint.sender_id)], 'complaint_reply', complaint_id=complaint.id)
+
+
+def _mark_complaint_seen(complaint, user):
+    """تعليم شكوى واحدة كمقروءة حسب الدور (تحديث مشروط + العداد). False إذا لم يكن مسموحًا."""
+    role = getattr(user, 'role', None)
+    rows = Complaint.objects.filter(pk=complaint.pk)
+    with transaction.atomic():
+        if user == complaint.sender:
+            if rows.filter(is_seen_by_employee=False).update(is_seen_by_employee=True) and complaint.is_responded:
+                UnreadCounter.add(users=[user.id], complaints=-1)
+        elif role in ['manager', 'hr'] and complaint.recipient_type == role:
+            if rows.filter(is_seen_by_recipient=False).update(is_seen_by_recipient=True):
+                UnreadCounter.add(role=role, complaints=-1)
+        else:
+            return False
+    return True
+
+
+def _mark_all_complaints_seen(user):
+    role = getattr(user, 'role', None)
+    with transaction.atomic():
+        if role in ['manager', 'hr']:
+            seen = Complaint.objects.filter(
+                recipient_type=role,
+                is_seen_by_recipient=False
+            ).update(is_seen_by_recipient=True)
+            UnreadCounter.add(role=role, complaints=-seen)
+        else:
+            seen = Complaint.objects.filter(
+                sender=user,
+                is_responded=True,
+                is_seen_by_employee=False
+            ).update(is_seen_by_employee=True)
+            UnreadCounter.add(users=[user.id], complaints=-seen)
+
+
+ANALYTICS_MAX_MONTHS = 36
+
+
+def _parse_month(value):
+    """'YYYY-MM' → (year, month)، أو None إذا لم تُرسل القيمة."""
+    if not value:
+        return None
+    year, month = (int(part) for part in value.split('-'))
+    if not 1 <= month <= 12 or year < 1:
+        raise ValueError(value)
+    return year, month
+
+
 # ====== داخل core/views.py: استبدل كتلة ComplaintViewSet بالكامل بما يلي ======
 class ComplaintViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     pagination_class = StandardResultsSetPagination
 
+    def _list_queryset(self):
+        # sender_username من نفس الاستعلام بدل استعلام لكل شكوى
+        return Complaint.objects.select_related('sender', 'responded_by').order_by('-created_at')
+
     def _paginate(self, request, queryset):
         paginator = self.pagination_class()
         page = paginator.paginate_queryset(queryset, request, view=self)
@@ -270,109 +798,134 @@ class ComplaintViewSet(viewsets.ViewSet):
         serializer = ComplaintSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         # الموظف رأى شكواه لحظة الإرسال، والجهة المستقبلة تراها غير مقروءة
-        complaint = serializer.save(
-            sender=request.user,
-            is_responded=False,
-            is_seen_by_recipient=False,
-            is_seen_by_employee=True
-        )
+        with transaction.atomic():
+            complaint = serializer.save(
+                sender=request.user,
+                is_responded=False,
+                is_seen_by_recipient=False,
+                is_seen_by_employee=True
+            )
+            UnreadCounter.add(role=complaint.recipient_type, complaints=1)
+            invalidate_complaint_stats(complaint)
+            publish_on_commit([role_channel(complaint.recipient_type)], 'complaint', complaint_id=complaint.id)
         return Response(ComplaintSerializer(complaint).data, status=status.HTTP_201_CREATED)
 
     # 2) شكاوى الموظف الحالي
     @action(detail=False, methods=['get'])
     def my_complaints(self, request):
-        qs = Complaint.objects.filter(sender=request.user).order_by('-created_at')
+        qs = self._list_queryset().filter(sender=request.user)
         return self._paginate(request, qs)
 
     # 3) شكاوى موجّهة للـ HR
     @action(detail=False, methods=['get'])
     def hr_complaints(self, request):
-        qs = Complaint.objects.filter(recipient_type='hr').order_by('-created_at')
+        qs = self._list_queryset().filter(recipient_type='hr')
         return self._paginate(request, qs)
 
     # 4) شكاوى موجّهة للمدير
     @action(detail=False, methods=['get'])
     def manager_complaints(self, request):
-        qs = Complaint.objects.filter(recipient_type='manager').order_by('-created_at')
+        qs = self._list_queryset().filter(recipient_type='manager')
         return self._paginate(request, qs)
 
+    # بحث نصي في الشكاوى (العنوان/النص/الرد) مرتب حسب الصلة مع تقسيم بالمؤشر:
+    # ?q=...&cursor=...&page_size=...&include_count=false
+    # HR / المدير: شكاوى دورهم، الموظف: شكاواه فقط
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'error': 'q is required'}, status=400)
+
+        user = request.user
+        role = getattr(user, 'role', None)
+        qs = self._list_queryset()
+        if role in ['manager', 'hr']:
+            qs = qs.filter(recipient_type=role)
+        else:
+            qs = qs.filter(sender=user)
+        qs = search_complaints(qs, query)
+
+        paginator = KeysetPagination()
+        size = paginator.get_page_size(request)
+        cursor = paginator.decode_cursor(request)
+        count = qs.count() if paginator.include_count(request) else None
+        if cursor is not None:
+            try:
+                rank, complaint_id = float(cursor[0]), int(cursor[1])
+            except (IndexError, TypeError, ValueError):
+                raise NotFound('Invalid cursor')
+            qs = qs.filter(dj_models.Q(rank__lt=rank) | dj_models.Q(rank=rank, id__lt=complaint_id))
+
+        results = list(qs.order_by('-rank', '-id')[:size + 1])
+        page = results[:size]
+        next_key = (page[-1].rank, page[-1].id) if len(results) > size else None
+        serializer = ComplaintSerializer(page, many=True)
+        return paginator.get_paginated_response(request, serializer.data, next_key, count=count)
+
+    # إحصائيات زمن الرد لكل جهة ولكل شهر (محسوبة في قاعدة البيانات ومخزنة مؤقتًا لكل شهر):
+    # ?from=2025-01&to=2025-12 (الافتراضي آخر 12 شهرًا). المدير: كل الجهات، HR: شكاوى HR فقط
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        role = getattr(request.user, 'role', None)
+        if role not in ['manager', 'hr']:
+            return Response({'error': 'Not allowed'}, status=403)
+
+        today = timezone.localdate()
+        default_first = (today.year - 1, today.month + 1) if today.month < 12 else (today.year, 1)
+        try:
+            first = _parse_month(request.query_params.get('from')) or default_first
+            last = _parse_month(request.query_params.get('to')) or (today.year, today.month)
+        except ValueError:
+            return Response({'error': 'from / to must be YYYY-MM'}, status=400)
+        if first > last:
+            return Response({'error': 'from must not be after to'}, status=400)
+        if (last[0] - first[0]) * 12 + last[1] - first[1] >= ANALYTICS_MAX_MONTHS:
+            return Response({'error': f'At most {ANALYTICS_MAX_MONTHS} months'}, status=400)
+
+        rows = complaint_stats(first, last)
+        if role == 'hr':
+            rows = [row for row in rows if row['recipient_type'] == 'hr']
+        return Response({
+            'from': '%04d-%02d' % first,
+            'to': '%04d-%02d' % last,
+            'results': rows,
+        })
+
     # 5) رد HR على شكوى
     @action(detail=True, methods=['post'])
     def hr_reply(self, request, pk=None):
-        complaint = get_object_or_404(Complaint, pk=pk, recipient_type='hr')
         response_text = request.data.get('response')
         if not response_text:
             return Response({'error': 'Response is required'}, status=400)
-
-        complaint.response = response_text
-        complaint.is_responded = True
-        complaint.responded_by = request.user
-        complaint.responded_at = timezone.now()
-        complaint.is_seen_by_recipient = True     # الجهة المعالجة قرأتها
-        complaint.is_seen_by_employee = False     # الموظف لديه رد جديد غير مقروء
-        complaint.save(update_fields=[
-            'response','is_responded','responded_by','responded_at',
-            'is_seen_by_recipient','is_seen_by_employee'
-        ])
+        with transaction.atomic():
+            complaint = get_object_or_404(Complaint.objects.select_for_update(), pk=pk, recipient_type='hr')
+            _save_complaint_reply(complaint, response_text, request.user)
         return Response({'status': 'Response saved'})
 
     # 6) رد المدير على شكوى
     @action(detail=True, methods=['post'])
     def manager_reply(self, request, pk=None):
-        complaint = get_object_or_404(Complaint, pk=pk, recipient_type='manager')
         response_text = request.data.get('response')
         if not response_text:
             return Response({'error': 'Response is required'}, status=400)
-
-        complaint.response = response_text
-        complaint.is_responded = True
-        complaint.responded_by = request.user
-        complaint.responded_at = timezone.now()
-        complaint.is_seen_by_recipient = True
-        complaint.is_seen_by_employee = False
-        complaint.save(update_fields=[
-            'response','is_responded','responded_by','responded_at',
-            'is_seen_by_recipient','is_seen_by_employee'
-        ])
+        with transaction.atomic():
+            complaint = get_object_or_404(Complaint.objects.select_for_update(), pk=pk, recipient_type='manager')
+            _save_complaint_reply(complaint, response_text, request.user)
         return Response({'status': 'Response saved'})
 
     # 7) تعليم شكوى واحدة كمقروءة حسب الدور
     @action(detail=True, methods=['post'])
     def mark_seen(self, request, pk=None):
         complaint = get_object_or_404(Complaint, pk=pk)
-        user = request.user
-        role = getattr(user, 'role', None)
-
-        if user == complaint.sender:
-            complaint.is_seen_by_employee = True
-            fields = ['is_seen_by_employee']
-        elif role in ['manager', 'hr'] and complaint.recipient_type == role:
-            complaint.is_seen_by_recipient = True
-            fields = ['is_seen_by_recipient']
-        else:
+        if not _mark_complaint_seen(complaint, request.user):
             return Response({'error': 'Not allowed'}, status=403)
-
-        complaint.save(update_fields=fields)
         return Response({'message': 'Marked as seen'})
 
     # 8) تعليم الكل كمقروء (مسار يطلبه الفرونت: /api/complaints/mark_all_seen/)
     @action(detail=False, methods=['post'])
     def mark_all_seen(self, request):
-        user = request.user
-        role = getattr(user, 'role', None)
-
-        if role in ['manager', 'hr']:
-            Complaint.objects.filter(
-                recipient_type=role,
-                is_seen_by_recipient=False
-            ).update(is_seen_by_recipient=True)
-        else:
-            Complaint.objects.filter(
-                sender=user,
-                is_responded=True,
-                is_seen_by_employee=False
-            ).update(is_seen_by_employee=True)
-
+        _mark_all_complaints_seen(request.user)
         return Response({'message': 'OK'})
 
 
@@ -406,6 +959,110 @@ def has_unread_complaints(request):
     return Response({'has_new': has_new})
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def unread_counts(request):
+    """
+    عدادات الشارات في طلب واحد رخيص (من UnreadCounter بدل COUNT على الجداول):
+      notifications: الموجّهة + العامة غير المقروءة
+      complaints:    بنفس قواعد has_unread_complaints حسب الدور
+    """
+    return Response(UnreadCounter.unread_for(request.user))
+
+
+def _sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+EVENT_STREAM_TICKET_SALT = 'core.event_stream'
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def event_stream_ticket(request):
+    """
+    تذكرة قصيرة العمر لفتح /api/events/?ticket=... (EventSource لا يرسل رؤوسًا مخصصة).
+    بدل وضع JWT نفسه (صالح لأيام) في الرابط حيث يظهر في سجلات الخوادم والوكلاء.
+    عند انقطاع الاتصال بعد انتهاء التذكرة يطلب العميل تذكرة جديدة.
+    """
+    max_age = getattr(settings, 'EVENT_STREAM_TICKET_MAX_AGE', 60)
+    ticket = signing.dumps(request.user.pk, salt=EVENT_STREAM_TICKET_SALT)
+    return Response({'ticket': ticket, 'expires_in': max_age})
+
+
+def _event_stream_user(request):
+    """المستخدم من Authorization: Bearer أو ?ticket= من event_stream_ticket."""
+    ticket = request.GET.get('ticket')
+    if ticket:
+        try:
+            user_id = signing.loads(
+                ticket, salt=EVENT_STREAM_TICKET_SALT,
+                max_age=getattr(settings, 'EVENT_STREAM_TICKET_MAX_AGE', 60),
+            )
+        except signing.BadSignature:  # يشمل SignatureExpired
+            return None
+        return CustomUser.objects.filter(pk=user_id, is_active=True).first()
+
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    raw = authenticator.get_raw_token(header) if header else None
+    if not raw:
+        return None
+    try:
+        return authenticator.get_user(authenticator.get_validated_token(raw))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+async def event_stream(request):
+    """
+    قناة دفع (Server-Sent Events) بدل الاستطلاع الدوري:
+      event: counts            عند الاتصال (نفس unread-counts/)
+      event: notification      {"notification_id"}
+      event: complaint         شكوى جديدة لصندوق الدور (hr / manager)
+      event: complaint_reply   رد على شكوى المستخدم
+      event: task              تغيّر حالة مهمة أو إنجاز مرحلة
+      event: resync            فاتت أحداث (اتصال بطيء): أعد جلب كل شيء
+    المصادقة: Authorization: Bearer أو ?ticket= من POST events/ticket/ (لا يُقبل JWT في الرابط).
+    تتطلب التشغيل عبر ASGI (model_system.asgi:application، مثلًا uvicorn / daphne)؛
+    تحت WSGI ترجع 501 لأن الاتصال المفتوح يحجز عاملًا كاملًا.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'The event stream requires the ASGI server.'}, status=501)
+    user = await sync_to_async(_event_stream_user)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    channels = [user_channel(user.id), BROADCAST]
+    role = getattr(user, 'role', None)
+    if role in ('hr', 'manager'):
+        channels.append(role_channel(role))
+    heartbeat = getattr(settings, 'EVENT_STREAM_HEARTBEAT', 15)
+
+    async def stream():
+        subscription = hub.subscribe(channels)
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse('counts', await sync_to_async(UnreadCounter.unread_for)(user))
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield _sse('resync', {})
+                yield _sse(event['type'], event)
+        finally:
+            hub.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: لا تخزين مؤقت للبث
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def mark_complaint_as_seen(request, pk):
@@ -414,19 +1071,8 @@ def mark_complaint_as_seen(request, pk):
     /api/complaints/<pk>/mark_seen/
     """
     complaint = get_object_or_404(Complaint, pk=pk)
-    user = request.user
-    role = getattr(user, 'role', None)
-
-    if user == complaint.sender:
-        complaint.is_seen_by_employee = True
-        fields = ['is_seen_by_employee']
-    elif role in ['manager', 'hr'] and complaint.recipient_type == role:
-        complaint.is_seen_by_recipient = True
-        fields = ['is_seen_by_recipient']
-    else:
+    if not _mark_complaint_seen(complaint, request.user):
         return Response({'error': 'Not allowed'}, status=403)
-
-    complaint.save(update_fields=fields)
     return Response({'message': 'Marked as seen'})
 
 
@@ -437,51 +1083,136 @@ def mark_all_complaints_seen(request):
     مسار علوي قديم (موجود في urls.py باسم mark-all-complaints-seen/).
     أبقيناه لكنه الآن يحدّث الحقول الصحيحة.
     """
-    user = request.user
-    role = getattr(user, 'role', None)
-
-    if role == 'manager':
-        Complaint.objects.filter(
-            recipient_type='manager',
-            is_seen_by_recipient=False
-        ).update(is_seen_by_recipient=True)
-    elif role == 'hr':
-        Complaint.objects.filter(
-            recipient_type='hr',
-            is_seen_by_recipient=False
-        ).update(is_seen_by_recipient=True)
-    else:
-        Complaint.objects.filter(
-            sender=user,
-            is_responded=True,
-            is_seen_by_employee=False
-        ).update(is_seen_by_employee=True)
-
+    _mark_all_complaints_seen(request.user)
     return Response({'status': 'All marked as seen'})
 
 # === [Tasks Feature] Views ===
 from rest_framework import viewsets as _vs, status as _status
 from rest_framework.decorators import action as _action
 from rest_framework.response import Response as _Response
-from django.db.models import Q as _Q
+from django.db.models import Count as _Count, Exists as _Exists, Max as _Max, OuterRef as _OuterRef, Q as _Q, Subquery as _Subquery
+from django.db.models.functions import Coalesce as _Coalesce
+
+from .models import Task, TaskPhase, TaskRecipient, TaskComment, TaskStatus
+from .serializers import TaskSerializer, TaskListSerializer, TaskCommentSerializer, _infer_role
+
+# الإجراءات التي تعيد المهمة كاملة (المراحل + المستلمون)
+_TASK_DETAIL_ACTIONS = ("create", "retrieve", "update", "partial_update")
+
+
+def _parse_date_bound(value, name, end_of_day=False):
+    """
+    'YYYY-MM-DD' أو تاريخ ووقت ISO → datetime بتوقيت الخادم.
+    مع end_of_day يصبح التاريخ المجرد بداية اليوم التالي (حد علوي حصري).
+    """
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: "Use YYYY-MM-DD or an ISO datetime."})
+        if end_of_day:
+            day += timedelta(days=1)
+        moment = datetime.combine(day, datetime.min.time())
+    elif end_of_day:
+        moment += timedelta(microseconds=1)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _task_count(model, **filters):
+    """COUNT لكل مهمة كاستعلام فرعي، حتى لا تتضاعف الصفوف بين عدة عدادات مع JOIN."""
+    counts = (
+        model.objects.filter(task=_OuterRef("pk"), **filters)
+        .order_by().values("task").annotate(n=_Count("id")).values("n")
+    )
+    return _Coalesce(_Subquery(counts), 0)
+
+def _publish_task_event(task, **data):
+    """حدث مهمة لمستلميها (مستخدمين أو فريق HR) ولمنشئها."""
+    channels = {user_channel(task.created_by_id)}
+    for user_id, is_hr_team in task.recipients.values_list('user_id', 'is_hr_team'):
+        channels.add(role_channel('hr') if is_hr_team else user_channel(user_id))
+    publish_on_commit(channels, 'task', task_id=task.id, status=task.status, **data)
 
-from .models import Task, TaskPhase, TaskRecipient, TaskComment
-from .serializers import TaskSerializer, TaskCommentSerializer, _infer_role
 
 class TaskViewSet(_vs.ModelViewSet):
     pagination_class = StandardResultsSetPagination
     serializer_class = TaskSerializer
 
+    def get_serializer_class(self):
+        # القائمة: صف مختصر (?expand=phases,recipients لإضافة التفاصيل)، والباقي: المهمة كاملة
+        if self.action == "list":
+            return TaskListSerializer
+        return TaskSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == "list":
+            context["expand"] = self._expand()
+        return context
+
+    def _expand(self):
+        raw = self.request.query_params.get("expand", "")
+        names = {name.strip() for name in raw.split(",") if name.strip()}
+        unknown = names - set(TaskListSerializer.EXPANDABLE)
+        if unknown:
+            raise ValidationError({"expand": f"Allowed values: {', '.join(TaskListSerializer.EXPANDABLE)}."})
+        return names
+
     def get_queryset(self):
         user = self.request.user
         role = _infer_role(user)
-        base = Task.objects.all().select_related("created_by").prefetch_related("phases", "recipients", "comments")
+        # العدادات في نفس الاستعلام؛ الـ prefetch فقط لما سيُعرض فعلًا
+        base = Task.objects.all().annotate(
+            phase_total=_task_count(TaskPhase),
+            phase_success_total=_task_count(TaskPhase, status="success"),
+        )
+        if self.action == "list":
+            expand = self._expand()
+            base = base.annotate(
+                recipient_total=_task_count(TaskRecipient, user__isnull=False),
+                has_hr_team=_Exists(TaskRecipient.objects.filter(task=_OuterRef("pk"), is_hr_team=True)),
+                comment_total=_task_count(TaskComment),
+            )
+            if "phases" in expand:
+                base = base.prefetch_related("phases")
+            if "recipients" in expand:
+                base = base.prefetch_related("recipients__user")
+        elif self.action in _TASK_DETAIL_ACTIONS:
+            base = base.prefetch_related("phases", "recipients__user")
+
+        if self.action == "list":
+            base = self._filter_list(base)
 
+        # الظهور عبر Exists (semi-join على فهارس TaskRecipient) بدل JOIN + distinct
         if role in ("manager", "general_manager"):
             return base.filter(creator_role="management").order_by("-created_at")
         if role == "hr":
-            return base.filter(_Q(creator_role="hr") | _Q(recipients__is_hr_team=True)).distinct().order_by("-created_at")
-        return base.filter(recipients__user_id=user.id).distinct().order_by("-created_at")
+            hr_team = TaskRecipient.objects.filter(task=_OuterRef("pk"), is_hr_team=True)
+            return base.filter(_Q(creator_role="hr") | _Exists(hr_team)).order_by("-created_at")
+        mine = TaskRecipient.objects.filter(task=_OuterRef("pk"), user_id=user.id)
+        return base.filter(_Exists(mine)).order_by("-created_at")
+
+    def _filter_list(self, queryset):
+        """?status=open,failed و ?created_after= / ?created_before= (تاريخ أو تاريخ ووقت ISO)."""
+        params = self.request.query_params
+        statuses = [value.strip() for value in params.get("status", "").split(",") if value.strip()]
+        if statuses:
+            unknown = set(statuses) - set(TaskStatus.values)
+            if unknown:
+                raise ValidationError({"status": f"Allowed values: {', '.join(TaskStatus.values)}."})
+            queryset = queryset.filter(status__in=statuses)
+
+        after = _parse_date_bound(params.get("created_after"), "created_after")
+        if after is not None:
+            queryset = queryset.filter(created_at__gte=after)
+        before = _parse_date_bound(params.get("created_before"), "created_before", end_of_day=True)
+        if before is not None:
+            queryset = queryset.filter(created_at__lt=before)
+        return queryset
 
     def perform_create(self, serializer):
         role = _infer_role(self.request.user)
@@ -490,7 +1221,7 @@ class TaskViewSet(_vs.ModelViewSet):
         serializer.save()
 
     def perform_update(self, serializer):
-        instance = self.get_object()
+        instance = serializer.instance
         role = _infer_role(self.request.user)
         if role in ("manager", "general_manager") and instance.creator_role != "management":
             raise PermissionError("Managers can edit only management tasks.")
@@ -505,6 +1236,7 @@ class TaskViewSet(_vs.ModelViewSet):
         if role not in ("hr", "manager", "general_manager"):
             return _Response({"detail": "Not allowed."}, status=_status.HTTP_403_FORBIDDEN)
         task.cancel(request.user)
+        _publish_task_event(task)
         return _Response({"status": task.status})
 
     @_action(detail=True, methods=["post"], url_path="mark-failed")
@@ -514,6 +1246,7 @@ class TaskViewSet(_vs.ModelViewSet):
         if role not in ("hr", "manager", "general_manager"):
             return _Response({"detail": "Not allowed."}, status=_status.HTTP_403_FORBIDDEN)
         task.mark_failed(request.user)
+        _publish_task_event(task)
         return _Response({"status": task.status})
 
     @_action(detail=True, methods=["post"], url_path="mark-success")
@@ -523,6 +1256,7 @@ class TaskViewSet(_vs.ModelViewSet):
         if role not in ("hr", "manager", "general_manager"):
             return _Response({"detail": "Not allowed."}, status=_status.HTTP_403_FORBIDDEN)
         task.mark_success(request.user)
+        _publish_task_event(task)
         return _Response({"status": task.status})
 
     @_action(detail=True, methods=["post"], url_path="complete-next-phase")
@@ -531,30 +1265,67 @@ class TaskViewSet(_vs.ModelViewSet):
         user = request.user
         role = _infer_role(user)
 
-        can_employee = task.recipients.filter(user_id=user.id).exists()
-        can_hr_team = role == "hr" and task.recipients.filter(is_hr_team=True).exists()
-        if not (can_employee or can_hr_team):
+        allowed = _Q(user_id=user.id) | _Q(is_hr_team=True) if role == "hr" else _Q(user_id=user.id)
+        if not task.recipients.filter(allowed).exists():
             return _Response({"detail": "Not allowed."}, status=_status.HTTP_403_FORBIDDEN)
-        if task.status != "open":
-            return _Response({"detail": "Task is already closed."}, status=_status.HTTP_400_BAD_REQUEST)
 
-        result = (request.data or {}).get("result")
+        data = request.data or {}
+        result = data.get("result")
         if result not in ("success", "failed"):
             return _Response({"detail": "Invalid result."}, status=_status.HTTP_400_BAD_REQUEST)
-
-        next_phase = task.phases.filter(status="pending").order_by("order").first()
-        if not next_phase:
-            return _Response({"detail": "No pending phases."}, status=_status.HTTP_400_BAD_REQUEST)
-
-        next_phase.complete(result)
-        return _Response({"phase_id": next_phase.id, "order": next_phase.order, "status": next_phase.status})
+        # auto_close: إغلاق المهمة تلقائيًا عند حسم آخر مرحلة (success إن نجحت كلها، وإلا failed)
+        auto_close = data.get("auto_close", getattr(settings, "TASK_AUTO_CLOSE", False))
+        auto_close = str(auto_close).lower() in ("1", "true", "yes")
+
+        with transaction.atomic():
+            # قفل صف المهمة: طلبات الإكمال المتزامنة لنفس المهمة تمر واحدًا تلو الآخر
+            task = Task.objects.select_for_update().get(pk=task.pk)
+            if task.status != "open":
+                return _Response({"detail": "Task is already closed."}, status=_status.HTTP_400_BAD_REQUEST)
+
+            next_phase = task.phases.filter(status="pending").order_by("order").first()
+            if not next_phase:
+                return _Response({"detail": "No pending phases."}, status=_status.HTTP_400_BAD_REQUEST)
+
+            # تحديث مشروط: على القواعد بلا SELECT ... FOR UPDATE (SQLite) لا تُحسم المرحلة مرتين
+            completed_at = timezone.now()
+            if not TaskPhase.objects.filter(pk=next_phase.pk, status="pending").update(
+                status=result, completed_at=completed_at
+            ):
+                return _Response(
+                    {"detail": "Phase was completed by another request, retry."}, status=_status.HTTP_409_CONFLICT
+                )
+            next_phase.status, next_phase.completed_at = result, completed_at
+
+            counts = task.phases.aggregate(
+                total=_Count("id"),
+                success=_Count("id", filter=_Q(status="success")),
+                pending=_Count("id", filter=_Q(status="pending")),
+            )
+            task.phase_total, task.phase_success_total = counts["total"], counts["success"]
+            if auto_close and counts["pending"] == 0:
+                if counts["success"] == counts["total"]:
+                    task.mark_success(user)
+                else:
+                    task.mark_failed(user)
+
+            _publish_task_event(task, phase_id=next_phase.id, phase_status=next_phase.status)
+
+        return _Response({
+            "phase_id": next_phase.id,
+            "order": next_phase.order,
+            "status": next_phase.status,
+            "task_status": task.status,
+            "total_phases": task.total_phases,
+            "success_phases": task.success_phases,
+            "progress_percent": task.progress_percent,
+        })
 
     @_action(detail=True, methods=["get", "post"], url_path="comments")
     def comments(self, request, pk=None):
         task = self.get_object()
         if request.method.lower() == "get":
-            data = TaskCommentSerializer(task.comments.order_by("created_at"), many=True).data
-            return _Response(data)
+            return self._comment_thread(request, task)
 
         if task.status != "open":
             return _Response({"detail": "Task is closed."}, status=_status.HTTP_400_BAD_REQUEST)
@@ -575,6 +1346,51 @@ class TaskViewSet(_vs.ModelViewSet):
         comment = TaskComment.objects.create(task=task, author=user, text=text)
         return _Response(TaskCommentSerializer(comment).data, status=_status.HTTP_201_CREATED)
 
+    def _comment_thread(self, request, task):
+        """
+        بدون معاملات: كل التعليقات (الشكل القديم).
+        ?since=<آخر id لدى العميل> / ?cursor= / ?page_size=: التعليقات الأحدث فقط بترتيب الإنشاء مع تقسيم بالمؤشر.
+        ETag من آخر تعليق وعدد التعليقات ونافذة الصفحة (after / page_size): نفس الصفحة من خيط غير متغير ترجع 304 بدون جسم.
+        """
+        params = request.query_params
+        paginator = KeysetPagination()
+        cursor = paginator.decode_cursor(request)
+        if cursor is not None:
+            try:
+                after = int(cursor[0])
+            except (IndexError, TypeError, ValueError):
+                raise NotFound("Invalid cursor")
+        else:
+            try:
+                after = int(params.get("since") or 0)
+            except ValueError:
+                raise ValidationError({"since": "Must be a comment id."})
+
+        comments = TaskComment.objects.filter(task=task)
+        state = comments.aggregate(
+            last=_Max("id"), total=_Count("id"), matching=_Count("id", filter=_Q(id__gt=after)),
+        )
+        paged = any(name in params for name in ("since", "cursor", "page_size"))
+        size = paginator.get_page_size(request)
+        include_count = paginator.include_count(request)
+        window = f"after-{after}-size-{size}-count-{int(include_count)}" if paged else "all"
+        etag = quote_etag(f"task-{task.id}-comments-{state['last'] or 0}-{state['total']}-{window}")
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            rows = comments.filter(id__gt=after).select_related("author").order_by("id")
+            if not paged:
+                response = _Response(TaskCommentSerializer(rows, many=True).data)
+            else:
+                page = list(rows[:size + 1])
+                next_key = (page[size - 1].id,) if len(page) > size else None
+                count = state["matching"] if include_count else None
+                response = paginator.get_paginated_response(
+                    request, TaskCommentSerializer(page[:size], many=True).data, next_key, count=count
+                )
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
 
 
 
@@ -630,12 +1446,16 @@ class SurveyViewSet(viewsets.ModelViewSet):
             .order_by("-created_at")
         )
 
+        return self.visible_to(base, user)
+
+    @staticmethod
+    def visible_to(queryset, user):
         role = (getattr(user, "role", "") or "").lower()
         if role in (CreatorRole.MANAGER, CreatorRole.HR):
             # المدير/HR: يرى فقط استبيانات الدور الخاص به (بغض النظر عن الحالة)
-            return base.filter(creator_role=role)
+            return queryset.filter(creator_role=role)
         # الموظف (وأي دور غير معروف): يرى فقط المنشور Published
-        return base.filter(status=SurveyStatus.PUBLISHED)
+        return queryset.filter(status=SurveyStatus.PUBLISHED)
 
     def get_serializer_class(self):
         if self.action in ("create", "update", "partial_update"):
@@ -893,4 +1713,43 @@ class MeView(APIView):
             "points": getattr(u, "points", 0),
             "avatar": (u.avatar.url if getattr(u, "avatar", None) else None),
         }
-        return Response(payload)
\ No newline at end of file
+        return Response(payload)
+
+# 📊 ملخص شارات لوحة التحكم في طلب واحد (بدل me/ + has_unread + user-notifications + tasks + surveys)
+class DashboardSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        counts = UnreadCounter.unread_for(user)
+
+        # مهامي المفتوحة (نفس صلاحية complete-next-phase) ومراحلها المعلقة في استعلام واحد
+        mine = TaskRecipient.objects.filter(task=dj_models.OuterRef('pk'), user_id=user.id)
+        if _infer_role(user) == 'hr':
+            mine = TaskRecipient.objects.filter(
+                dj_models.Q(user_id=user.id) | dj_models.Q(is_hr_team=True), task=dj_models.OuterRef('pk')
+            )
+        tasks = Task.objects.filter(dj_models.Exists(mine), status='open').aggregate(
+            open_tasks=dj_models.Count('id', distinct=True),
+            pending_phases=dj_models.Count('phases', filter=dj_models.Q(phases__status='pending')),
+        )
+
+        # نفس نطاق SurveyViewSet: المدير/HR لا يُحتسب له إلا استبيانات دوره
+        visible = SurveyViewSet.visible_to(Survey.objects.all(), user)
+        pending_surveys = visible.filter(status=SurveyStatus.PUBLISHED).exclude(
+            dj_models.Exists(SurveySubmission.objects.filter(survey=dj_models.OuterRef('pk'), user=user))
+        ).count()
+
+        payload = {
+            'unread_notifications': counts['notifications'],
+            'unread_complaints': counts['complaints'],
+            'open_tasks': tasks['open_tasks'],
+            'pending_task_phases': tasks['pending_phases'],
+            'pending_surveys': pending_surveys,
+        }
+        # ETag من المحتوى: الملخص غير المتغير يرجع 304 بدون جسم
+        etag = quote_etag(hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag) or Response(payload)
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
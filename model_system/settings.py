@@ -184,6 +184,49 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# ختم النماذج في preview-form/:
+# "incremental" يلحق قسم تحديث بنهاية الملف الأصلي دون إعادة كتابته (مع رجوع تلقائي لإعادة الكتابة)
+# "rewrite" يعيد كتابة الملف كاملًا عبر PyPDF2 في كل طلب
+FORM_STAMP_ENGINE = os.getenv("FORM_STAMP_ENGINE", "incremental")
+# ناتج مسار إعادة الكتابة يبقى في الذاكرة حتى هذا الحجم ثم يُنقل إلى ملف مؤقت على القرص
+FORM_STAMP_SPOOL_MAX_BYTES = int(os.getenv("FORM_STAMP_SPOOL_MAX_BYTES", str(4 * 1024 * 1024)))
+# مجمّع عمليات لمسار إعادة الكتابة (لكل عامل gunicorn مجمّعه الخاص)، 0 = التنفيذ داخل الطلب
+FORM_STAMP_POOL_SIZE = int(os.getenv("FORM_STAMP_POOL_SIZE", "0"))
+# عدد المهام المنتظرة فوق العمال قبل الرد بـ 503 + Retry-After
+FORM_STAMP_QUEUE_DEPTH = int(os.getenv("FORM_STAMP_QUEUE_DEPTH", "8"))
+# مهلة المهمة بالثواني؛ بعدها يُرجع الملف الأصلي بدون ختم
+FORM_STAMP_TIMEOUT = float(os.getenv("FORM_STAMP_TIMEOUT", "10"))
+FORM_STAMP_RETRY_AFTER = int(os.getenv("FORM_STAMP_RETRY_AFTER", "5"))
+
+# رقم العامل (0-999) داخل الرقم التسلسلي للختم؛ يجب أن يكون مختلفًا لكل عامل gunicorn على كل خادم
+# (مثلًا يُضبط في post_fork: os.environ["STAMP_WORKER_ID"] = str(node * 100 + worker.age % 100)).
+# إن تُرك فارغًا تحجز كل عملية أصغر رقم غير مستخدم من جدول StampWorker عند أول ختم.
+STAMP_WORKER_ID = os.getenv("STAMP_WORKER_ID")
+# ثواني بقاء حجز رقم العامل دون تجديد؛ العملية تجدده كل ثلث المدة أثناء الختم،
+# والحجز المنتهي (عملية متوقفة) يعود رقمه متاحًا. يجب أن يتجاوز فرق الساعات بين الخوادم بكثير.
+STAMP_WORKER_TTL = int(os.getenv("STAMP_WORKER_TTL", "3600"))
+
+# مدة التخزين المؤقت (ثواني) لمعاينة النماذج العامة؛ التحقق بعدها رخيص عبر ETag (304)
+FORM_PREVIEW_MAX_AGE = int(os.getenv("FORM_PREVIEW_MAX_AGE", "86400"))
+
+# تسليم الملفات عبر الخادم الأمامي بعد تحقق Django: "python" (افتراضي) | "x-accel-redirect" (nginx) | "x-sendfile" (Apache/lighttpd)
+# nginx مثال:  location /protected-media/ { internal; alias /opt/media/; }
+FILE_DELIVERY_BACKEND = os.getenv("FILE_DELIVERY_BACKEND", "python")
+FILE_DELIVERY_ACCEL_PREFIX = os.getenv("FILE_DELIVERY_ACCEL_PREFIX", "/protected-media/")
+
+# قناة الأحداث /api/events/ (SSE، تعمل تحت ASGI فقط): ثواني بين رسائل ping لإبقاء الاتصال مفتوحًا
+EVENT_STREAM_HEARTBEAT = int(os.getenv("EVENT_STREAM_HEARTBEAT", "15"))
+# عمر تذكرة الاتصال بالقناة (ثواني) من POST /api/events/ticket/؛ تُمرَّر ?ticket= بدل JWT
+# لأن رمز الوصول يعيش 30 يومًا والرابط يُحفظ في سجلات الخوادم والوكلاء
+EVENT_STREAM_TICKET_MAX_AGE = int(os.getenv("EVENT_STREAM_TICKET_MAX_AGE", "60"))
+
+# مدة تخزين إحصائيات الشكاوى الشهرية (ثواني)؛ الإرسال والرد يحذفان شهر الشكوى فورًا.
+# مع أكثر من عملية يجب أن يكون CACHES مشتركًا (Redis/Memcached) ليصل الحذف لكل العمال
+COMPLAINT_STATS_CACHE_TIMEOUT = int(os.getenv("COMPLAINT_STATS_CACHE_TIMEOUT", "3600"))
+
+# إغلاق المهمة تلقائيًا (success/failed) عند حسم آخر مرحلة عبر complete-next-phase؛ يمكن تجاوزه بـ auto_close في الطلب
+TASK_AUTO_CLOSE = os.getenv("TASK_AUTO_CLOSE", "false").lower() in ("1", "true", "yes")
+
 
 
 